@@ -1,17 +1,25 @@
-from flask import Flask, request, Response, send_from_directory
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime, timedelta
-import os, json, uuid, requests, logging
-from twilio.rest import Client
+from flask import Flask, request, Response, send_from_directory, jsonify
+from datetime import datetime
+import os, uuid, logging, threading
+import xml.etree.ElementTree as ET
 from pydub import AudioSegment
-from gtts import gTTS
-import whisper
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import numpy as np
 from apscheduler.schedulers.background import BackgroundScheduler
+from modules.clients import provider as clients
+from modules.ledger_cache import LedgerCache
+from modules.ledger_rollups import LedgerRollups
+from modules.ledger_columns import ColumnarLedger
+from modules.task_queue import WorkerPool, KeyedExecutor
+from modules.idempotency import IdempotencyCache
+from modules.outbound_dispatcher import dispatcher as despacho
+from modules.transcription_service import service as transcricao
+from modules.model_tiers import policy as politica_modelos
+from modules.tts_cache import synthesizer as sintetizador
+from modules.audio_pipeline import download_audio, decode_audio, trim_silence, SAMPLE_RATE
+from modules.transcript_cache import TranscriptCache, content_key
+from utils.money import parse_brl_cents, format_brl, to_cents
 
 # Inicialização do Flask
 app = Flask(__name__)
@@ -26,20 +34,69 @@ os.makedirs(STATIC_DIR, exist_ok=True)
 logger = logging.getLogger()
 logging.basicConfig(level=logging.INFO)
 
-# Autenticação com Google Sheets
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-json_creds = os.environ.get("GOOGLE_CREDS_JSON")
-creds_dict = json.loads(json_creds)
-creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-client = gspread.authorize(creds)
-spreadsheet = client.open_by_key("1vKrmgkMTDwcx5qufF-YRvsXSk99J1Vq9-LwuQINwcl8")
-sheet = spreadsheet.sheet1
-
-# Autenticação Twilio
-twilio_sid = os.environ.get("TWILIO_SID")
-twilio_token = os.environ.get("TWILIO_TOKEN")
+# Clientes do Google Sheets e do Twilio, conectados só no primeiro uso
+# (local conforme SHEETS_BACKEND / TWILIO_BACKEND)
+sheet = clients.sheet
+
+# Cópia local da planilha usada pelos resumos
+ledger = LedgerCache(
+    sheet,
+    sync_interval=int(os.environ.get("LEDGER_SYNC_SECONDS", 30)),
+    buffered=True,
+    max_batch_rows=int(os.environ.get("SHEET_WRITE_BATCH_ROWS", 20)),
+    flush_interval=float(os.environ.get("SHEET_WRITE_WINDOW_SECONDS", 0.5))
+)
+
+# Totais pré-agregados por dia/mês × categoria × responsável
+rollups = LedgerRollups(ledger)
+
+# Colunas NumPy para resumos por período/responsável
+colunas = ColumnarLedger(ledger)
+
+# Cliente Twilio (criado no primeiro envio)
 twilio_number = os.environ.get("TWILIO_NUMBER")
-twilio_client = Client(twilio_sid, twilio_token)
+twilio_client = clients.twilio
+# Todas as mensagens de saída passam pelo despachante compartilhado (despacho):
+# limite de envios por segundo do número, novas tentativas em 429/5xx e ordem
+# por destinatário
+
+# Fila de mensagens recebidas: o webhook só enfileira e responde na hora.
+# Mensagens do mesmo remetente são processadas em ordem; remetentes diferentes, em paralelo.
+pool_mensagens = WorkerPool(
+    num_workers=int(os.environ.get("WEBHOOK_WORKERS", 4)),
+    max_queue=int(os.environ.get("WEBHOOK_QUEUE_SIZE", 100)),
+    name="webhook"
+)
+fila_mensagens = KeyedExecutor(pool_mensagens, max_pending=int(os.environ.get("WEBHOOK_QUEUE_SIZE", 100)))
+
+# MessageSids já recebidos, para ignorar as novas tentativas do Twilio
+mensagens_processadas = IdempotencyCache(
+    ttl=int(os.environ.get("MESSAGE_DEDUP_TTL", 24 * 3600)),
+    max_entries=int(os.environ.get("MESSAGE_DEDUP_MAX_ENTRIES", 10000)),
+    spill_path=os.environ.get("MESSAGE_DEDUP_DB")
+)
+# Prazo da reserva "processando": se o worker ou o processo cair antes de concluir,
+# as tentativas do Twilio depois desse prazo reprocessam a mensagem. A reserva é
+# renovada quando o worker começa; o padrão cobre o pior caso a partir daí
+# (download 30 s + decodificação 60 s + duas transcrições + gravação na planilha 30 s + folga)
+MESSAGE_CLAIM_LEASE = int(os.environ.get("MESSAGE_CLAIM_LEASE_SECONDS", 0)) or int(150 + 2 * transcricao.timeout)
+
+# Transcrições já feitas, pelo hash do áudio (áudios encaminhados/reenviados)
+cache_transcricoes = TranscriptCache(
+    max_entries=int(os.environ.get("TRANSCRIPT_CACHE_ENTRIES", 1000)),
+    disk_path=os.environ.get("TRANSCRIPT_CACHE_DB"),
+    max_disk_bytes=int(os.environ.get("TRANSCRIPT_CACHE_MAX_BYTES", 20 * 1024 * 1024))
+)
+
+# Confirmação falada para despesas enviadas por áudio
+AUDIO_CONFIRMATIONS = os.environ.get("AUDIO_CONFIRMATIONS", "1") != "0"
+
+# Remoção de silêncio (VAD) antes da transcrição
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "1") != "0"
+
+# Tempo que o webhook espera a resposta para devolvê-la direto no TwiML
+# (o Twilio desiste do webhook após 15 s)
+WEBHOOK_INLINE_BUDGET = float(os.environ.get("WEBHOOK_INLINE_BUDGET_SECONDS", 5))
 
 # Mapeamento de número para responsável
 responsaveis_por_numero = {
@@ -60,6 +117,7 @@ def enviar_lembrete():
             }
         ]
 
+        envios = []
         for contato in contatos:
             if contato["nome"].upper() == "LARISSA":
                 mensagem = "🔔 Oi Larissa! Já cadastrou suas despesas de hoje? 📝"
@@ -68,29 +126,46 @@ def enviar_lembrete():
             else:
                 mensagem = "🔔 Lembrete: não esqueça de registrar suas despesas hoje! 😉"
 
-            twilio_client.messages.create(
-                body=mensagem,
-                from_=twilio_number,
-                to=contato["numero"]
-            )
+            envios.append((contato, despacho.send(contato["numero"], mensagem)))
+
+        # Os lembretes saem em paralelo; aguarda cada um só para registrar o envio
+        for contato, envio in envios:
+            envio.result(timeout=60)
             logger.info(f"Lembrete enviado para {contato['nome']} ({contato['numero']})")
 
     except Exception as e:
         logger.error(f"Erro ao enviar lembretes personalizados: {e}")
 
+# Sobe os processos de transcrição (cada um carrega e aquece o seu Whisper)
+# antes das threads do agendador; WHISPER_WARMUP: background, sync ou off
+modo_aquecimento = os.environ.get("WHISPER_WARMUP", "background").lower()
+if modo_aquecimento != "off":
+    transcricao.start(wait=(modo_aquecimento == "sync"))
+
 scheduler = BackgroundScheduler()
 scheduler.add_job(enviar_lembrete, 'cron', hour=20, minute=0)  # Ajuste o horário aqui se quiser
+scheduler.add_job(ledger.reconcile, 'interval', minutes=int(os.environ.get("LEDGER_RECONCILE_MINUTES", 10)))
+scheduler.add_job(ledger.sync, 'interval', seconds=ledger.sync_interval)
+scheduler.add_job(clients.refresh_credentials, 'interval', minutes=5)
 scheduler.start()
 
 # Funções auxiliares
+def resposta_twiml(texto=None, media_url=None):
+    """Monta uma resposta TwiML com uma <Message> (texto e/ou mídia), escapando o XML"""
+    raiz = ET.Element("Response")
+    if texto or media_url:
+        mensagem = ET.SubElement(raiz, "Message")
+        if texto:
+            ET.SubElement(mensagem, "Body").text = texto
+        if media_url:
+            ET.SubElement(mensagem, "Media").text = media_url
+    return Response(ET.tostring(raiz, encoding="unicode"), mimetype="application/xml")
+
 def parse_valor(valor_str):
-    try:
-        return float(str(valor_str).replace("R$", "").replace(".", "").replace(",", ".").strip())
-    except:
-        return 0.0
+    return (parse_brl_cents(valor_str) or 0) / 100
 
 def formatar_valor(valor):
-    return f"R${valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    return format_brl(to_cents(valor))
 
 palavras_categoria = {
     "alimentação": ["mercado", "supermercado", "pão", "leite", "feira", "comida","alimentação","almoço","janta","jantar"],
@@ -108,100 +183,115 @@ def classificar_categoria(descricao):
     return "OUTROS"
 
 def gerar_audio(texto):
-    """Gera um arquivo de áudio a partir do texto e retorna o caminho"""
+    """Gera (ou reaproveita do cache) um arquivo de áudio com o texto e retorna o caminho"""
     try:
-        audio_id = uuid.uuid4().hex
-        mp3_path = os.path.join(STATIC_DIR, f"audio_{audio_id}.mp3")
-        tts = gTTS(text=texto, lang='pt')
-        tts.save(mp3_path)
+        mp3_path = sintetizador.speak(texto)
         logger.info(f"Áudio gerado com sucesso: {mp3_path}")
         return mp3_path
     except Exception as e:
         logger.error(f"Erro ao gerar áudio: {e}")
         return None
 
+def url_estatica(caminho):
+    """URL pública de um arquivo dentro de STATIC_DIR"""
+    caminho_relativo = os.path.relpath(caminho, STATIC_DIR).replace(os.sep, "/")
+    return f"{BASE_URL}/static/{caminho_relativo}"
+
+def confirmacao_em_audio(categoria, valor_cents):
+    """URL da confirmação falada de uma despesa, montada com fragmentos em cache; None se falhar"""
+    try:
+        return url_estatica(sintetizador.expense_confirmation(categoria, valor_cents))
+    except Exception as e:
+        logger.error(f"Erro ao gerar confirmação em áudio: {e}")
+        return None
+
+def enviar_confirmacao_audio(from_number, categoria, valor_cents):
+    """Envia a confirmação falada de uma despesa (melhor esforço, depois da resposta em texto)"""
+    audio_url = confirmacao_em_audio(categoria, valor_cents)
+    if audio_url:
+        despacho.send(from_number, media_url=[audio_url])
+
 def enviar_mensagem_audio(from_number, texto):
     try:
-        twilio_client.messages.create(
-            body=texto,
-            from_=twilio_number,
-            to=from_number
-        )
+        despacho.send(from_number, texto)
         mp3_path = gerar_audio(texto)
         if mp3_path:
-            audio_url = f"{BASE_URL}/static/{os.path.basename(mp3_path)}"
-            twilio_client.messages.create(
-                from_=twilio_number,
-                to=from_number,
-                media_url=[audio_url]
-            )
+            despacho.send(from_number, media_url=[url_estatica(mp3_path)])
         return Response("<Response></Response>", mimetype="application/xml")
     except Exception as e:
         logger.error(f"Erro ao enviar mensagem: {e}")
         return Response("<Response></Response>", mimetype="application/xml")
 
-import subprocess
-
-def convert_to_wav(input_path, output_path):
-    try:
-        result = subprocess.run([
-            "ffmpeg", "-y", "-i", input_path, "-ar", "16000", "-ac", "1", output_path
-        ], capture_output=True, text=True)
-
-        if result.returncode != 0:
-            logger.error(f"Erro na conversão com ffmpeg: {result.stderr}")
-            return False
+def mensagem_reconhecida(texto):
+    """True se o texto é um comando conhecido ou uma despesa no formato 'data, descrição, valor'"""
+    texto = (texto or "").lower()
+    if "ajuda" in texto or "resumo" in texto:
         return True
-    except Exception as e:
-        logger.error(f"Falha ao executar ffmpeg: {e}")
-        return False
+    partes = [p.strip() for p in texto.split(",")]
+    return len(partes) == 3 and (parse_brl_cents(partes[2]) or 0) > 0
 
 def processar_audio(media_url):
     try:
-        audio_id = uuid.uuid4().hex
-        audio_path = os.path.join(STATIC_DIR, f"received_{audio_id}.ogg")
-        wav_path = os.path.join(STATIC_DIR, f"received_{audio_id}.wav")
-
-        # Baixa o arquivo de áudio
-        response = requests.get(media_url)
-        if response.status_code != 200:
-            logger.error(f"Erro ao baixar áudio: status {response.status_code}")
+        dados_audio = download_audio(media_url)
+        if dados_audio is None:
             return None
 
-        with open(audio_path, "wb") as f:
-            f.write(response.content)
-        logger.info(f"Áudio salvo em: {audio_path}")
+        # Mesmo áudio já transcrito: responde sem decodificar nem passar pelo Whisper
+        chave = content_key(dados_audio)
+        texto = cache_transcricoes.get(chave)
+        if texto is not None:
+            logger.info(f"Transcrição em cache: {texto}")
+            return texto
 
-        # Converte para WAV
-        sucesso = convert_to_wav(audio_path, wav_path)
-        if not sucesso:
+        # Decodifica em memória (ffmpeg via pipe) direto para PCM 16 kHz
+        audio = decode_audio(dados_audio)
+        if audio is None:
             return None
 
-        # Transcreve com Whisper
-        model = whisper.load_model("tiny")
-        result = model.transcribe(wav_path, language="pt")
-        texto = result["text"]
-
-        os.remove(audio_path)
-        os.remove(wav_path)
-
-        logger.info(f"Transcrição: {texto}")
-        return texto.strip()
+        # Corta silêncios antes do Whisper (o custo cresce com a duração)
+        if VAD_ENABLED:
+            audio = trim_silence(audio)
+
+        # Transcreve no pool de transcrição, fora da thread da requisição, com o
+        # modelo escolhido pela duração do áudio e pela carga atual
+        duracao = len(audio) / SAMPLE_RATE
+        modelo = politica_modelos.choose(duracao)
+        texto = transcricao.transcribe(audio, model_name=modelo, language="pt")["text"].strip()
+        logger.info(f"Transcrição ({modelo}): {texto}")
+
+        # Se não virou um comando nem uma despesa válida, tenta um modelo maior
+        maior = None if mensagem_reconhecida(texto) else politica_modelos.upgrade(modelo, duracao)
+        if maior:
+            nova = transcricao.transcribe(audio, model_name=maior, language="pt")["text"].strip()
+            logger.info(f"Nova transcrição ({maior}): {nova}")
+            if mensagem_reconhecida(nova) or not texto:
+                texto = nova
+
+        # Só guarda transcrições aproveitáveis, para uma nova tentativa poder acertar
+        if mensagem_reconhecida(texto):
+            cache_transcricoes.put(chave, texto)
+        return texto
 
     except Exception as e:
         logger.error(f"Erro ao processar áudio: {e}")
         return None
 
 def gerar_grafico(tipo, titulo, dados, categorias=None, nome_arquivo=None):
+    # Figura própria (API orientada a objetos): os resumos rodam em paralelo no
+    # pool de mensagens e o estado global do pyplot não é seguro entre threads
     try:
-        plt.figure(figsize=(10, 6))
-        plt.title(titulo)
-        plt.rcParams.update({'font.size': 14})
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        ax.set_title(titulo, fontsize=14)
+        ax.tick_params(labelsize=14)
 
         if tipo == 'barra':
-            plt.bar(categorias, dados)
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
+            ax.bar(categorias, dados)
+            ax.tick_params(axis='x', labelrotation=45)
+            for rotulo in ax.get_xticklabels():
+                rotulo.set_horizontalalignment('right')
+            fig.tight_layout()
         elif tipo == 'pizza':
             if len(categorias) > 6:
                 top_indices = np.argsort(dados)[-5:]
@@ -212,12 +302,14 @@ def gerar_grafico(tipo, titulo, dados, categorias=None, nome_arquivo=None):
                 top_dados.append(outros_valor)
                 categorias = top_categorias
                 dados = top_dados
-            plt.pie(dados, labels=categorias, autopct='%1.1f%%', startangle=90, shadow=True)
-            plt.axis('equal')
+            ax.pie(dados, labels=categorias, autopct='%1.1f%%', startangle=90, shadow=True, textprops={'fontsize': 14})
+            ax.axis('equal')
         elif tipo == 'linha':
-            plt.plot(categorias, dados, marker='o', linestyle='-')
-            plt.xticks(rotation=45, ha='right')
-            plt.tight_layout()
+            ax.plot(categorias, dados, marker='o', linestyle='-')
+            ax.tick_params(axis='x', labelrotation=45)
+            for rotulo in ax.get_xticklabels():
+                rotulo.set_horizontalalignment('right')
+            fig.tight_layout()
 
         if not nome_arquivo:
             nome_arquivo = f"grafico_{uuid.uuid4().hex}.png"
@@ -226,8 +318,7 @@ def gerar_grafico(tipo, titulo, dados, categorias=None, nome_arquivo=None):
         # Garantir que o diretório existe
         os.makedirs(os.path.dirname(caminho_arquivo), exist_ok=True)
         
-        plt.savefig(caminho_arquivo, dpi=100, bbox_inches='tight')
-        plt.close()
+        fig.savefig(caminho_arquivo, dpi=100, bbox_inches='tight')
         logger.info(f"Gráfico gerado com sucesso: {caminho_arquivo}")
         return caminho_arquivo
     except Exception as e:
@@ -237,22 +328,16 @@ def gerar_grafico(tipo, titulo, dados, categorias=None, nome_arquivo=None):
 def enviar_mensagens_twilio(from_number, texto, grafico_url=None):
     """Função auxiliar para enviar mensagens via Twilio com tratamento de erros"""
     try:
-        # Enviar mensagem de texto
-        msg_text = twilio_client.messages.create(
-            body=texto,
-            from_=twilio_number,
-            to=from_number
-        )
-        logger.info(f"Mensagem de texto enviada: {msg_text.sid}")
-        
-        # Se houver gráfico, enviar como mídia
+        # Enfileira o texto e o gráfico juntos; o despachante mantém a ordem
+        envio_texto = despacho.send(from_number, texto)
+        envio_midia = None
         if grafico_url:
-            msg_media = twilio_client.messages.create(
-                body="📊 Gráfico de despesas",
-                from_=twilio_number,
-                to=from_number,
-                media_url=[grafico_url]
-            )
+            envio_midia = despacho.send(from_number, "📊 Gráfico de despesas", media_url=[grafico_url])
+
+        msg_text = envio_texto.result(timeout=60)
+        logger.info(f"Mensagem de texto enviada: {msg_text.sid}")
+        if envio_midia is not None:
+            msg_media = envio_midia.result(timeout=60)
             logger.info(f"Mensagem com mídia enviada: {msg_media.sid}")
         
         return True
@@ -263,26 +348,13 @@ def enviar_mensagens_twilio(from_number, texto, grafico_url=None):
 def gerar_resumo_geral(from_number):
     try:
         logger.info(f"Gerando resumo geral para {from_number}")
-        registros = sheet.get_all_records()
-        total = 0.0
-        categorias = {}
-
-        for r in registros:
-            valor = r.get("Valor", "0")
-            valor_float = parse_valor(valor)
-            total += valor_float
-            categoria = r.get("Categoria", "OUTROS")
-            categorias[categoria] = categorias.get(categoria, 0) + valor_float
+        categorias, total, _ = rollups.totals_by_category()
 
         resumo = f"📊 Resumo Geral:\n\nTotal registrado: {formatar_valor(total)}"
         
         # Verificar se há categorias para evitar erro ao gerar gráfico vazio
         if not categorias:
-            twilio_client.messages.create(
-                body=resumo + "\n\nNão há despesas registradas.",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, resumo + "\n\nNão há despesas registradas.")
             return Response("<Response></Response>", mimetype="application/xml")
             
         categorias_ordenadas = sorted(categorias.items(), key=lambda x: x[1], reverse=True)
@@ -293,7 +365,7 @@ def gerar_resumo_geral(from_number):
         
         if not grafico_path:
             # Se falhar ao gerar o gráfico, enviar apenas o texto
-            twilio_client.messages.create(body=resumo, from_=twilio_number, to=from_number)
+            despacho.send(from_number, resumo)
             return Response("<Response></Response>", mimetype="application/xml")
             
         grafico_url = f"{BASE_URL}/static/{os.path.basename(grafico_path)}"
@@ -303,21 +375,13 @@ def gerar_resumo_geral(from_number):
         
         if not sucesso:
             # Tentar enviar apenas o texto como fallback
-            twilio_client.messages.create(
-                body=resumo + "\n\n(Não foi possível gerar o gráfico)",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, resumo + "\n\n(Não foi possível gerar o gráfico)")
             
         return Response("<Response></Response>", mimetype="application/xml")
     except Exception as e:
         logger.error(f"Erro no resumo geral: {e}")
         try:
-            twilio_client.messages.create(
-                body="❌ Erro ao gerar resumo geral. Por favor, tente novamente mais tarde.",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, "❌ Erro ao gerar resumo geral. Por favor, tente novamente mais tarde.")
         except:
             pass
         return Response("<Response><Message>❌ Erro no resumo geral.</Message></Response>", mimetype="application/xml")
@@ -326,22 +390,14 @@ def gerar_resumo_hoje(from_number):
     try:
         logger.info(f"Gerando resumo de hoje para {from_number}")
         hoje = datetime.now().strftime("%d/%m/%Y")
-        registros = sheet.get_all_records()
-        total = 0.0
-        categorias = {}
-
-        for r in registros:
-            if r.get("Data") == hoje:
-                valor = parse_valor(r.get("Valor", "0"))
-                total += valor
-                categoria = r.get("Categoria", "OUTROS")
-                categorias[categoria] = categorias.get(categoria, 0) + valor
+        hoje_ordinal = datetime.now().toordinal()
+        categorias, total, _ = colunas.totals_by_category(hoje_ordinal, hoje_ordinal)
 
         resumo = f"📅 Resumo de Hoje ({hoje}):\n\nTotal registrado: {formatar_valor(total)}"
         
         if not categorias:
             resumo += "\n\nNão há despesas registradas para hoje."
-            twilio_client.messages.create(body=resumo, from_=twilio_number, to=from_number)
+            despacho.send(from_number, resumo)
             return Response("<Response></Response>", mimetype="application/xml")
             
         categorias_ordenadas = sorted(categorias.items(), key=lambda x: x[1], reverse=True)
@@ -352,7 +408,7 @@ def gerar_resumo_hoje(from_number):
         
         if not grafico_path:
             # Se falhar ao gerar o gráfico, enviar apenas o texto
-            twilio_client.messages.create(body=resumo, from_=twilio_number, to=from_number)
+            despacho.send(from_number, resumo)
             return Response("<Response></Response>", mimetype="application/xml")
             
         grafico_url = f"{BASE_URL}/static/{os.path.basename(grafico_path)}"
@@ -362,21 +418,13 @@ def gerar_resumo_hoje(from_number):
         
         if not sucesso:
             # Tentar enviar apenas o texto como fallback
-            twilio_client.messages.create(
-                body=resumo + "\n\n(Não foi possível gerar o gráfico)",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, resumo + "\n\n(Não foi possível gerar o gráfico)")
             
         return Response("<Response></Response>", mimetype="application/xml")
     except Exception as e:
         logger.error(f"Erro no resumo de hoje: {e}")
         try:
-            twilio_client.messages.create(
-                body="❌ Erro ao gerar resumo de hoje. Por favor, tente novamente mais tarde.",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, "❌ Erro ao gerar resumo de hoje. Por favor, tente novamente mais tarde.")
         except:
             pass
         return Response("<Response><Message>❌ Erro no resumo de hoje.</Message></Response>", mimetype="application/xml")
@@ -384,22 +432,10 @@ def gerar_resumo_hoje(from_number):
 def gerar_resumo_categoria(from_number):
     try:
         logger.info(f"Gerando resumo por categoria para {from_number}")
-        registros = sheet.get_all_records()
-        categorias = {}
-        total = 0.0
-
-        for r in registros:
-            valor = parse_valor(r.get("Valor", "0"))
-            categoria = r.get("Categoria", "OUTROS")
-            categorias[categoria] = categorias.get(categoria, 0) + valor
-            total += valor
+        categorias, total, _ = rollups.totals_by_category()
 
         if not categorias:
-            twilio_client.messages.create(
-                body="📂 Resumo por Categoria:\n\nNão há despesas registradas.",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, "📂 Resumo por Categoria:\n\nNão há despesas registradas.")
             return Response("<Response></Response>", mimetype="application/xml")
 
         resumo = "📂 Resumo por Categoria:\n\n"
@@ -415,7 +451,7 @@ def gerar_resumo_categoria(from_number):
         
         if not grafico_path:
             # Se falhar ao gerar o gráfico, enviar apenas o texto
-            twilio_client.messages.create(body=resumo, from_=twilio_number, to=from_number)
+            despacho.send(from_number, resumo)
             return Response("<Response></Response>", mimetype="application/xml")
             
         grafico_url = f"{BASE_URL}/static/{os.path.basename(grafico_path)}"
@@ -425,21 +461,13 @@ def gerar_resumo_categoria(from_number):
         
         if not sucesso:
             # Tentar enviar apenas o texto como fallback
-            twilio_client.messages.create(
-                body=resumo + "\n\n(Não foi possível gerar o gráfico)",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, resumo + "\n\n(Não foi possível gerar o gráfico)")
             
         return Response("<Response></Response>", mimetype="application/xml")
     except Exception as e:
         logger.error(f"Erro no resumo por categoria: {e}")
         try:
-            twilio_client.messages.create(
-                body="❌ Erro ao gerar resumo por categoria. Por favor, tente novamente mais tarde.",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, "❌ Erro ao gerar resumo por categoria. Por favor, tente novamente mais tarde.")
         except:
             pass
         return Response("<Response><Message>❌ Erro no resumo por categoria.</Message></Response>", mimetype="application/xml")
@@ -447,30 +475,11 @@ def gerar_resumo_categoria(from_number):
 def gerar_resumo_mensal(from_number):
     try:
         logger.info(f"Gerando resumo mensal para {from_number}")
-        registros = sheet.get_all_records()
         hoje = datetime.now()
-        dias = {}
-
-        for r in registros:
-            data_str = r.get("Data", "")
-            if not data_str:
-                continue
-            try:
-                data = datetime.strptime(data_str, "%d/%m/%Y")
-                if data.month == hoje.month and data.year == hoje.year:
-                    dia = data.day
-                    valor = parse_valor(r.get("Valor", "0"))
-                    dias[dia] = dias.get(dia, 0) + valor
-            except Exception as e:
-                logger.warning(f"Erro ao processar data '{data_str}': {e}")
-                continue
+        dias = rollups.daily_totals(hoje.year, hoje.month)
 
         if not dias:
-            twilio_client.messages.create(
-                body=f"📅 Resumo do mês de {hoje.strftime('%B/%Y')}:\n\nNão há despesas registradas para este mês.",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, f"📅 Resumo do mês de {hoje.strftime('%B/%Y')}:\n\nNão há despesas registradas para este mês.")
             return Response("<Response></Response>", mimetype="application/xml")
 
         labels = [f"{dia}/{hoje.month}" for dia in sorted(dias.keys())]
@@ -487,7 +496,7 @@ def gerar_resumo_mensal(from_number):
         
         if not grafico_path:
             # Se falhar ao gerar o gráfico, enviar apenas o texto
-            twilio_client.messages.create(body=resumo, from_=twilio_number, to=from_number)
+            despacho.send(from_number, resumo)
             return Response("<Response></Response>", mimetype="application/xml")
             
         grafico_url = f"{BASE_URL}/static/{os.path.basename(grafico_path)}"
@@ -497,21 +506,13 @@ def gerar_resumo_mensal(from_number):
         
         if not sucesso:
             # Tentar enviar apenas o texto como fallback
-            twilio_client.messages.create(
-                body=resumo + "\n\n(Não foi possível gerar o gráfico)",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, resumo + "\n\n(Não foi possível gerar o gráfico)")
             
         return Response("<Response></Response>", mimetype="application/xml")
     except Exception as e:
         logger.error(f"Erro no resumo mensal: {e}")
         try:
-            twilio_client.messages.create(
-                body="❌ Erro ao gerar resumo mensal. Por favor, tente novamente mais tarde.",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, "❌ Erro ao gerar resumo mensal. Por favor, tente novamente mais tarde.")
         except:
             pass
         return Response("<Response><Message>❌ Erro no resumo mensal.</Message></Response>", mimetype="application/xml")
@@ -519,49 +520,9 @@ def gerar_resumo_mensal(from_number):
 def gerar_resumo(from_number, responsavel, dias, titulo):
     try:
         logger.info(f"Gerando {titulo} para {responsavel} (últimos {dias} dias)")
-        registros = sheet.get_all_records()
-        limite = datetime.now() - timedelta(days=dias)
-        total = 0.0
-        categorias = {}
-        contador = 0
-        
-        # Log para depuração
-        logger.info(f"Total de registros na planilha: {len(registros)}")
-
-        for r in registros:
-            # Log detalhado para depuração
-            logger.debug(f"Processando registro: {r}")
-            
-            data_str = r.get("Data", "")
-            if not data_str:
-                continue
-                
-            try:
-                try:
-                    data = datetime.strptime(data_str, "%d/%m/%Y")
-                except ValueError:
-                    data = datetime.strptime(data_str, "%Y-%m-%d")
-            except Exception as err:
-                logger.warning(f"Formato de data inválido: {data_str} | Erro: {err}")
-                continue
-
-            # Normaliza o responsável para comparação
-            resp_registro = r.get("Responsável", "").strip().upper()
-            resp_solicitado = responsavel.strip().upper()
-            
-            # Log para depuração da comparação
-            logger.debug(f"Comparando responsáveis: '{resp_registro}' com '{resp_solicitado}'")
-            
-            # Verifica se a data está no período e se o responsável corresponde
-            if data >= limite and (resp_solicitado == "TODOS" or resp_registro == resp_solicitado):
-                valor = parse_valor(r.get("Valor", "0"))
-                total += valor
-                categoria = r.get("Categoria", "OUTROS")
-                categorias[categoria] = categorias.get(categoria, 0) + valor
-                contador += 1
-                logger.debug(f"Registro contabilizado: {data_str}, {resp_registro}, {valor}")
-            else:
-                logger.debug(f"Registro ignorado: data={data >= limite}, resp={resp_solicitado == 'TODOS' or resp_registro == resp_solicitado}")
+        # Datas a partir de hoje - (dias - 1), sem limite superior
+        inicio = datetime.now().toordinal() - dias + 1
+        categorias, total, contador = colunas.totals_by_category(inicio, None, responsavel)
 
         # Log do resultado final
         logger.info(f"Resumo para {responsavel}: {contador} registros, total {total}")
@@ -570,7 +531,7 @@ def gerar_resumo(from_number, responsavel, dias, titulo):
 
         if not categorias:
             resumo += "\n\nNão há despesas registradas neste período."
-            twilio_client.messages.create(body=resumo, from_=twilio_number, to=from_number)
+            despacho.send(from_number, resumo)
             return Response("<Response></Response>", mimetype="application/xml")
 
         categorias_ordenadas = sorted(categorias.items(), key=lambda x: x[1], reverse=True)
@@ -581,7 +542,7 @@ def gerar_resumo(from_number, responsavel, dias, titulo):
         
         if not grafico_path:
             # Se falhar ao gerar o gráfico, enviar apenas o texto
-            twilio_client.messages.create(body=resumo, from_=twilio_number, to=from_number)
+            despacho.send(from_number, resumo)
             return Response("<Response></Response>", mimetype="application/xml")
             
         grafico_url = f"{BASE_URL}/static/{os.path.basename(grafico_path)}"
@@ -595,42 +556,142 @@ def gerar_resumo(from_number, responsavel, dias, titulo):
         
         if not sucesso:
             # Tentar enviar apenas o texto como fallback
-            twilio_client.messages.create(
-                body=resumo + "\n\n(Não foi possível gerar o gráfico)",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, resumo + "\n\n(Não foi possível gerar o gráfico)")
             
         return Response("<Response></Response>", mimetype="application/xml")
     except Exception as e:
         logger.error(f"Erro no resumo personalizado: {e}")
         try:
-            twilio_client.messages.create(
-                body=f"❌ Erro ao gerar {titulo.lower()}. Por favor, tente novamente mais tarde.",
-                from_=twilio_number,
-                to=from_number
-            )
+            despacho.send(from_number, f"❌ Erro ao gerar {titulo.lower()}. Por favor, tente novamente mais tarde.")
         except:
             pass
         return Response(f"<Response><Message>❌ Erro ao gerar {titulo.lower()}.</Message></Response>", mimetype="application/xml")
         
+class RespostaInline:
+    """Combina a resposta entre o webhook (que espera até um prazo) e o worker.
+
+    Sob o mesmo lock, ou o worker entrega a resposta ao webhook ainda esperando,
+    ou o webhook desiste primeiro e o worker envia via REST; nunca os dois.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pronta = threading.Event()
+        self._aguardando = True
+        self._resposta = None
+
+    def aguardar(self, timeout):
+        """Chamado pelo webhook: retorna a resposta se ficar pronta no prazo, senão None"""
+        self._pronta.wait(timeout)
+        with self._lock:
+            self._aguardando = False
+            return self._resposta
+
+    def entregar(self, resposta):
+        """Chamado pelo worker: retorna True se o webhook vai devolver a resposta"""
+        with self._lock:
+            if not self._aguardando:
+                return False
+            self._resposta = resposta
+        self._pronta.set()
+        return True
+
 @app.route("/whatsapp", methods=["POST"])
 def whatsapp():
+    dados = request.form.to_dict()
+    if not dados.get("From"):
+        logger.warning("Webhook recebido sem remetente, ignorando")
+        return Response("<Response></Response>", status=400, mimetype="application/xml")
+
+    # Nova tentativa do Twilio para uma mensagem já recebida: devolve o resultado guardado
+    sid = dados.get("MessageSid")
+    if sid:
+        nova, registro = mensagens_processadas.claim(sid, {"status": "processando"}, lease=MESSAGE_CLAIM_LEASE)
+        if not nova:
+            logger.info(f"Mensagem {sid} repetida ({registro.get('status')}), ignorando")
+            return Response(registro.get("resposta_webhook", "<Response></Response>"), mimetype="application/xml")
+
+    # Respostas rápidas (texto, sem resumo/gráfico) podem voltar no próprio webhook
+    inline = None
+    if not dados.get("MediaUrl0") and "resumo" not in dados.get("Body", "").lower():
+        inline = RespostaInline()
+
+    # Processa em segundo plano; se a fila estiver cheia, pede ao usuário para reenviar
+    # (o Twilio não refaz webhooks de mensagem que respondem 5xx)
+    if fila_mensagens.submit(dados["From"], processar_mensagem_em_segundo_plano, dados, inline) is None:
+        if sid:
+            mensagens_processadas.discard(sid)
+        return resposta_twiml("⏳ Estamos com muitas mensagens agora. Por favor, envie a sua de novo em alguns instantes.")
+
+    if inline is not None:
+        resposta = inline.aguardar(WEBHOOK_INLINE_BUDGET)
+        if resposta is not None:
+            return resposta
+        logger.info(f"Resposta para {dados['From']} será enviada via REST")
+    return Response("<Response></Response>", mimetype="application/xml")
+
+def entregar_resposta_twiml(from_number, resposta):
+    """Envia via REST as mensagens de uma resposta TwiML que não pôde voltar no webhook"""
+    try:
+        raiz = ET.fromstring(resposta.get_data(as_text=True))
+    except ET.ParseError as e:
+        logger.error(f"Resposta TwiML inválida: {e}")
+        return
+    for mensagem in raiz.iter("Message"):
+        corpo = mensagem.findtext("Body")
+        if corpo is None:
+            corpo = mensagem.text
+        midias = [m.text for m in mensagem.iter("Media") if m.text]
+        corpo = corpo.strip() if corpo and corpo.strip() else None
+        if corpo or midias:
+            despacho.send(from_number, corpo, media_url=midias)
+
+def processar_mensagem_em_segundo_plano(dados, inline=None):
+    from_number = dados.get("From")
+    # O tempo na fila não conta: o prazo da reserva recomeça quando o worker pega a mensagem
+    if dados.get("MessageSid"):
+        mensagens_processadas.renew(dados["MessageSid"], MESSAGE_CLAIM_LEASE)
     try:
-        return processar_mensagem()
+        resposta = processar_mensagem(dados)
     except Exception as e:
         logger.error(f"Erro interno: {e}")
-        return Response("<Response><Message>❌ Erro interno ao processar.</Message></Response>", mimetype="application/xml")
-
-def processar_mensagem():
-    msg = request.form.get("Body", "")
-    from_number = request.form.get("From")
-    media_url = request.form.get("MediaUrl0")
-    media_type = request.form.get("MediaContentType0")
+        resposta = Response("<Response><Message>❌ Erro interno ao processar.</Message></Response>", mimetype="application/xml")
+
+    # Só responde inline se não houver mensagens anteriores ainda na fila de envio,
+    # para não passar na frente delas
+    entregue_inline = (
+        inline is not None
+        and not despacho.queue_depths().get(from_number)
+        and inline.entregar(resposta)
+    )
+    if inline is not None and not entregue_inline:
+        inline.entregar(None)
+    if not entregue_inline:
+        try:
+            entregar_resposta_twiml(from_number, resposta)
+        except Exception as e:
+            logger.error(f"Erro ao entregar resposta para {from_number}: {e}")
+
+    # Novas tentativas do Twilio recebem a mesma resposta inline, ou TwiML vazio
+    # se ela já foi enviada via REST
+    if dados.get("MessageSid"):
+        mensagens_processadas.put(dados["MessageSid"], {
+            "status": "concluida",
+            "resposta": resposta.get_data(as_text=True),
+            "resposta_webhook": resposta.get_data(as_text=True) if entregue_inline else "<Response></Response>"
+        })
+    return resposta
+
+def processar_mensagem(dados):
+    msg = dados.get("Body", "")
+    from_number = dados.get("From")
+    media_url = dados.get("MediaUrl0")
+    media_type = dados.get("MediaContentType0")
 
     logger.info(f"Mensagem recebida de {from_number}: {msg}")
 
-    if media_url and "audio" in (media_type or ""):
+    veio_de_audio = bool(media_url and "audio" in (media_type or ""))
+    if veio_de_audio:
         try:
             msg = processar_audio(media_url)
             if not msg:
@@ -657,8 +718,7 @@ def processar_mensagem():
             "- resumo da Larissa\n"
             "- resumo do Thiago"
         )
-        twilio_client.messages.create(body=texto_ajuda, from_=twilio_number, to=from_number)
-        return Response("<Response></Response>", mimetype="application/xml")
+        return resposta_twiml(texto_ajuda)
 
     if "resumo geral" in msg:
         return gerar_resumo_geral(from_number)
@@ -701,13 +761,15 @@ def processar_mensagem():
     # Normaliza os dados
     descricao = descricao.upper()
     responsavel = responsavel.upper()
-    valor_float = parse_valor(valor)
-    valor_formatado = formatar_valor(valor_float)
+    valor_cents = parse_brl_cents(valor)
+    if valor_cents is None:
+        return Response("<Response><Message>❌ Valor inválido. Envie só um número, ex.: hoje, uber, 25,50</Message></Response>", mimetype="application/xml")
+    valor_formatado = format_brl(valor_cents)
 
-    # Salva na planilha
-    sheet.append_row([data_formatada, categoria, descricao, responsavel, valor_formatado])
+    # Salva na planilha (agrupada com outras gravações) e aguarda a confirmação
+    ledger.append_row([data_formatada, categoria, descricao, responsavel, valor_formatado]).result(timeout=30)
 
-    # Envia a confirmação
+    # Confirmação (devolvida no TwiML ou enviada via REST pelo worker)
     resposta = (
         f"✅ Despesa registrada!\n"
         f"📅 Data: {data_formatada}\n"
@@ -717,8 +779,22 @@ def processar_mensagem():
         f"💰 Valor: {valor_formatado}"
     )
 
-    twilio_client.messages.create(body=resposta, from_=twilio_number, to=from_number)
-    return Response("<Response></Response>", mimetype="application/xml")
+    # Despesa enviada por áudio: a confirmação também vai falada, sem atrasar o
+    # texto. A tarefa entra na fila do remetente e só roda depois que a atual
+    # (que entrega esta resposta) terminar
+    if veio_de_audio and AUDIO_CONFIRMATIONS:
+        if fila_mensagens.submit(from_number, enviar_confirmacao_audio, from_number, categoria, valor_cents) is None:
+            logger.warning(f"Fila cheia, confirmação em áudio para {from_number} não enviada")
+
+    return resposta_twiml(resposta)
+
+@app.route('/health')
+def health():
+    return jsonify({
+        "status": "ok",
+        "whisper_pronto": transcricao.is_ready(),
+        "cache_transcricoes": cache_transcricoes.stats()
+    })
 
 @app.route('/static/<path:path>')
 def serve_static(path):
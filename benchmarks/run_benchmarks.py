@@ -0,0 +1,126 @@
+# benchmarks/run_benchmarks.py
+"""Benchmark offline do assistente com planilha em memória e Twilio simulado.
+
+Uso:
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000,1000000 --repeat 5
+
+Mede processar_mensagem, todos os gerar_resumo_* e GoogleSheetsManager.get_expenses
+contra planilhas sintéticas, sem credenciais do Google ou do Twilio.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Backends locais precisam ser definidos antes de importar o app
+os.environ.setdefault("SHEETS_BACKEND", "memory")
+os.environ.setdefault("TWILIO_BACKEND", "recording")
+os.environ.setdefault("SHEET_WRITE_WINDOW_SECONDS", "0")
+os.environ.setdefault("TWILIO_MESSAGES_PER_SECOND", "100000")
+os.environ.setdefault("TWILIO_MESSAGES_BURST", "100000")
+os.environ.setdefault("WHISPER_WARMUP", "off")
+
+import app  # noqa: E402
+from modules.backends import InMemorySpreadsheet, DEFAULT_HEADERS  # noqa: E402
+from modules.google_sheets import GoogleSheetsManager  # noqa: E402
+
+CATEGORIAS = ["ALIMENTAÇÃO", "TRANSPORTE", "LAZER", "FIXOS", "SAÚDE", "OUTROS"]
+RESPONSAVEIS = ["LARISSA", "THIAGO"]
+NUMERO = "whatsapp:+5511975220021"
+
+def gerar_linhas(n, dias=730, seed=42):
+    """Gera n despesas sintéticas distribuídas nos últimos `dias` dias"""
+    rng = random.Random(seed)
+    hoje = datetime.now()
+    linhas = []
+    for _ in range(n):
+        data = (hoje - timedelta(days=rng.randint(0, dias))).strftime("%d/%m/%Y")
+        valor = app.formatar_valor(rng.randint(100, 50000) / 100)
+        linhas.append([data, rng.choice(CATEGORIAS), "DESPESA", rng.choice(RESPONSAVEIS), valor])
+    return linhas
+
+def medir(func, repeat):
+    """Executa func `repeat` vezes e retorna (mediana, mínimo) em milissegundos"""
+    tempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        func()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), min(tempos)
+
+def processar(corpo):
+    return app.processar_mensagem({"Body": corpo, "From": NUMERO})
+
+def registrar_despesa():
+    # Garante que o caso mede a gravação, e não o ramo de formato inválido
+    resposta = processar("hoje, uber, 25.50")
+    texto = resposta.get_data(as_text=True)
+    assert "Despesa registrada" in texto, f"resposta inesperada: {texto}"
+    return resposta
+
+def casos_app():
+    return [
+        ("processar_mensagem (despesa)", registrar_despesa),
+        ("gerar_resumo_geral", lambda: app.gerar_resumo_geral(NUMERO)),
+        ("gerar_resumo_hoje", lambda: app.gerar_resumo_hoje(NUMERO)),
+        ("gerar_resumo_categoria", lambda: app.gerar_resumo_categoria(NUMERO)),
+        ("gerar_resumo_mensal", lambda: app.gerar_resumo_mensal(NUMERO)),
+        ("gerar_resumo (semana, todos)", lambda: app.gerar_resumo(NUMERO, "TODOS", 7, "Resumo da Semana")),
+        ("gerar_resumo (mês, larissa)", lambda: app.gerar_resumo(NUMERO, "LARISSA", 30, "Resumo do Mês")),
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sem-grafico", action="store_true",
+                        help="substitui gerar_grafico por um no-op para medir só a agregação")
+    args = parser.parse_args()
+
+    if args.sem_grafico:
+        app.gerar_grafico = lambda *a, **k: None
+    inicio_execucao = time.time()
+
+    print(f"{'linhas':>10}  {'caso':<32} {'mediana (ms)':>13} {'mínimo (ms)':>12}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        linhas = gerar_linhas(n)
+
+        # Planilha do app: carga inicial (fria) e consultas com cache quente
+        app.sheet.replace_rows([DEFAULT_HEADERS] + linhas)
+        inicio = time.perf_counter()
+        app.ledger.reconcile()
+        print(f"{n:>10}  {'carga inicial do cache':<32} {(time.perf_counter() - inicio) * 1000:>13.2f} {'':>12}")
+        for nome, func in casos_app():
+            mediana, minimo = medir(func, args.repeat)
+            print(f"{n:>10}  {nome:<32} {mediana:>13.2f} {minimo:>12.2f}")
+        app.twilio_client.clear()
+
+        # GoogleSheetsManager com planilha em memória
+        planilha = InMemorySpreadsheet()
+        manager = GoogleSheetsManager(spreadsheet=planilha)
+        cabecalho = ["Data", "Categoria", "Descrição", "Valor", "Responsável", "Timestamp"]
+        planilha.worksheet("Despesas").replace_rows(
+            [cabecalho] + [[d, c, desc, v, r, ""] for d, c, desc, r, v in linhas]
+        )
+        manager.sync_expenses(full=True)
+        for nome, func in [
+            ("get_expenses", lambda: manager.get_expenses()),
+            ("get_expenses (mês + usuário)", lambda: manager.get_expenses({"month": datetime.now().month, "user": "larissa"})),
+            ("get_expense_totals", lambda: manager.get_expense_totals()),
+        ]:
+            mediana, minimo = medir(func, args.repeat)
+            print(f"{n:>10}  {nome:<32} {mediana:>13.2f} {minimo:>12.2f}")
+
+    # Remove os gráficos gerados durante a execução
+    for nome in os.listdir(app.STATIC_DIR):
+        caminho = os.path.join(app.STATIC_DIR, nome)
+        if nome.startswith("grafico_") and os.path.getmtime(caminho) >= inicio_execucao:
+            os.remove(caminho)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# benchmarks/stt_benchmark.py
+"""Compara os mecanismos de transcrição em uma pasta de áudios de exemplo.
+
+Uso:
+    python benchmarks/stt_benchmark.py --audio-dir amostras/ --engines whisper,faster-whisper --model tiny
+
+Cada áudio (.ogg, .opus, .mp3, .wav, .m4a) pode ter a transcrição de referência
+em um .txt com o mesmo nome, usada para calcular o WER. Cada mecanismo roda em
+um processo próprio, para o pico de memória (RSS) não se misturar.
+
+Relata, por mecanismo: fator de tempo real (RTF), latência p50/p95 por áudio,
+pico de RSS e WER.
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+import unicodedata
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.audio_pipeline import decode_audio, trim_silence, SAMPLE_RATE  # noqa: E402
+
+EXTENSOES = (".ogg", ".opus", ".mp3", ".wav", ".m4a")
+
+def normalizar(texto):
+    """Minúsculas, sem pontuação, separado em palavras"""
+    texto = "".join(" " if unicodedata.category(c).startswith("P") else c for c in texto.lower())
+    return texto.split()
+
+def distancia_palavras(referencia, hipotese):
+    """Distância de edição (substituições + inserções + remoções) entre listas de palavras"""
+    anterior = list(range(len(hipotese) + 1))
+    for i, ref in enumerate(referencia, 1):
+        atual = [i] + [0] * len(hipotese)
+        for j, hip in enumerate(hipotese, 1):
+            atual[j] = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + (ref != hip))
+        anterior = atual
+    return anterior[-1]
+
+def carregar_amostras(pasta):
+    amostras = []
+    for nome in sorted(os.listdir(pasta)):
+        base, ext = os.path.splitext(nome)
+        if ext.lower() not in EXTENSOES:
+            continue
+        referencia = None
+        caminho_ref = os.path.join(pasta, base + ".txt")
+        if os.path.exists(caminho_ref):
+            with open(caminho_ref, encoding="utf-8") as f:
+                referencia = f.read().strip()
+        amostras.append((nome, os.path.join(pasta, nome), referencia))
+    return amostras
+
+def executar_mecanismo(engine_name, model_name, amostras, language, vad, repeat):
+    """Roda em um processo separado: decodifica, aquece e mede cada áudio"""
+    from modules.stt_engines import get_engine
+
+    engine = get_engine(engine_name, model_name)
+    audios = []
+    for nome, caminho, referencia in amostras:
+        with open(caminho, "rb") as f:
+            pcm = decode_audio(f.read())
+        if pcm is None:
+            continue
+        if vad:
+            pcm = trim_silence(pcm)
+        audios.append((nome, pcm, referencia))
+
+    engine.warmup()
+    latencias, duracoes, hipoteses = [], [], []
+    for nome, pcm, referencia in audios:
+        for _ in range(repeat):
+            inicio = time.perf_counter()
+            texto = engine.transcribe(pcm, language=language)["text"]
+            latencias.append(time.perf_counter() - inicio)
+            duracoes.append(len(pcm) / SAMPLE_RATE)
+        hipoteses.append((nome, texto, referencia))
+
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    return {"latencias": latencias, "duracoes": duracoes, "hipoteses": hipoteses, "rss_mb": rss_mb}
+
+def resumir(resultado):
+    latencias = np.array(resultado["latencias"])
+    erros = palavras = 0
+    for _, texto, referencia in resultado["hipoteses"]:
+        if referencia is not None:
+            ref = normalizar(referencia)
+            erros += distancia_palavras(ref, normalizar(texto))
+            palavras += len(ref)
+    return {
+        "audios": len(resultado["hipoteses"]),
+        "segundos": sum(resultado["duracoes"]),
+        "rtf": latencias.sum() / sum(resultado["duracoes"]) if resultado["duracoes"] else 0.0,
+        "p50": np.percentile(latencias, 50) if len(latencias) else 0.0,
+        "p95": np.percentile(latencias, 95) if len(latencias) else 0.0,
+        "rss_mb": resultado["rss_mb"],
+        "wer": erros / palavras if palavras else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--audio-dir", required=True)
+    parser.add_argument("--engines", default="whisper,faster-whisper")
+    parser.add_argument("--model", default="tiny")
+    parser.add_argument("--language", default="pt")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--sem-vad", action="store_true", help="não remove silêncios antes de transcrever")
+    parser.add_argument("--verbose", action="store_true", help="mostra cada transcrição")
+    args = parser.parse_args()
+
+    amostras = carregar_amostras(args.audio_dir)
+    if not amostras:
+        print(f"Nenhum áudio encontrado em {args.audio_dir}")
+        return
+
+    print(f"{len(amostras)} áudios, modelo {args.model}")
+    print(f"{'mecanismo':<16} {'áudios':>6} {'seg. áudio':>10} {'RTF':>7} {'p50 (s)':>8} {'p95 (s)':>8} {'RSS (MB)':>9} {'WER':>7}")
+    contexto = multiprocessing.get_context("spawn")
+    for engine_name in [e.strip() for e in args.engines.split(",") if e.strip()]:
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as executor:
+                resultado = executor.submit(
+                    executar_mecanismo, engine_name, args.model, amostras, args.language, not args.sem_vad, args.repeat
+                ).result()
+        except Exception as e:
+            print(f"{engine_name:<16} indisponível: {e}")
+            continue
+
+        r = resumir(resultado)
+        wer = f"{r['wer']:.1%}" if r["wer"] is not None else "-"
+        print(
+            f"{engine_name:<16} {r['audios']:>6} {r['segundos']:>10.1f} {r['rtf']:>7.3f} "
+            f"{r['p50']:>8.2f} {r['p95']:>8.2f} {r['rss_mb']:>9.0f} {wer:>7}"
+        )
+        if args.verbose:
+            for nome, texto, referencia in resultado["hipoteses"]:
+                print(f"    {nome}: {texto.strip()}" + (f"  [ref: {referencia}]" if referencia else ""))
+
+if __name__ == "__main__":
+    main()
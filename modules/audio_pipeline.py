@@ -0,0 +1,183 @@
+# modules/audio_pipeline.py
+import subprocess
+import threading
+import logging
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+CHUNK_SIZE = 64 * 1024
+
+_session = requests.Session()
+
+def _ffmpeg_command(sample_rate):
+    # Lê o áudio (qualquer formato) do stdin e escreve PCM 16 bits mono no stdout
+    return [
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(sample_rate),
+        "pipe:1"
+    ]
+
+def _feed(stdin, chunks, errors):
+    try:
+        for chunk in chunks:
+            if chunk:
+                stdin.write(chunk)
+    except BrokenPipeError:
+        # O ffmpeg parou de ler (entrada inválida); o erro aparece no stderr
+        pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+def _drain(stream, output):
+    output.append(stream.read())
+
+def _kill(process, expired):
+    expired.set()
+    process.kill()
+
+def decode_audio(source, sample_rate=SAMPLE_RATE, timeout=60):
+    """Decodifica áudio em memória para um array float32 mono em [-1, 1].
+
+    `source` pode ser bytes ou um iterável de blocos de bytes (ex.: o download
+    em streaming), que são enviados ao stdin do ffmpeg enquanto o PCM é lido do
+    stdout. Se o ffmpeg não terminar em `timeout` segundos, ele é encerrado.
+    Retorna None se a decodificação falhar.
+    """
+    try:
+        process = subprocess.Popen(
+            _ffmpeg_command(sample_rate),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except Exception as e:
+        logger.error(f"Falha ao executar ffmpeg: {e}")
+        return None
+
+    errors = []
+    if isinstance(source, (bytes, bytearray)):
+        try:
+            pcm, stderr = process.communicate(bytes(source), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            logger.error(f"Decodificação com ffmpeg excedeu {timeout}s")
+            return None
+    else:
+        # Escreve e lê o stderr em outras threads: com um pipe cheio (stdout
+        # ou mensagens de erro de um arquivo corrompido) o ffmpeg travaria
+        writer = threading.Thread(target=_feed, args=(process.stdin, source, errors), daemon=True)
+        saida_erro = []
+        leitor = threading.Thread(target=_drain, args=(process.stderr, saida_erro), daemon=True)
+        expirou = threading.Event()
+        limite = threading.Timer(timeout, _kill, args=(process, expirou))
+        writer.start()
+        leitor.start()
+        limite.start()
+        try:
+            pcm = process.stdout.read()
+            process.wait()
+        finally:
+            limite.cancel()
+        leitor.join()
+        writer.join(timeout=1)
+        stderr = saida_erro[0] if saida_erro else b""
+        if expirou.is_set():
+            logger.error(f"Decodificação com ffmpeg excedeu {timeout}s")
+            return None
+
+    if errors:
+        logger.error(f"Erro ao ler o áudio de entrada: {errors[0]}")
+        return None
+    if process.returncode != 0:
+        logger.error(f"Erro na decodificação com ffmpeg: {stderr.decode(errors='replace').strip()}")
+        return None
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+def trim_silence(audio, sample_rate=SAMPLE_RATE, frame_ms=30, min_silence_ms=600, padding_ms=200,
+                 threshold_db=-45.0, noise_ratio=2.5, max_threshold_db=-35.0, min_range_db=20.0):
+    """Remove silêncios do início, do fim e pausas longas (VAD por energia).
+
+    Cada quadro de frame_ms é considerado fala se a energia RMS passar do maior
+    entre threshold_db (dBFS) e noise_ratio vezes o ruído de fundo estimado.
+    O ruído de fundo (10º percentil) só é usado quando fica ao menos
+    min_range_db abaixo da fala (90º percentil), ou seja, quando o áudio tem
+    silêncio de verdade; e o limiar adaptativo nunca passa de max_threshold_db,
+    para uma nota que já começa falando não perder os trechos mais baixos.
+    Pausas mais curtas que min_silence_ms são mantidas e cada trecho de fala
+    ganha padding_ms de margem. Se nenhuma fala for detectada, devolve o áudio
+    original para não descartar uma gravação baixa.
+    """
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return audio
+
+    rms = np.sqrt(np.mean(np.square(audio[:n_frames * frame].reshape(n_frames, frame)), axis=1))
+    threshold = 10 ** (threshold_db / 20)
+    noise, speech = np.percentile(rms, [10, 90])
+    if noise * 10 ** (min_range_db / 20) <= speech:
+        threshold = max(threshold, min(noise * noise_ratio, 10 ** (max_threshold_db / 20)))
+    voiced = rms > threshold
+    if not voiced.any():
+        logger.info("VAD não detectou fala, mantendo o áudio completo")
+        return audio
+
+    # Margem ao redor da fala e preenchimento das pausas curtas
+    pad = max(1, padding_ms // frame_ms)
+    keep = np.convolve(voiced, np.ones(2 * pad + 1), mode="same") > 0
+    indices = np.flatnonzero(keep)
+    gaps = np.diff(indices) - 1
+    max_gap = min_silence_ms // frame_ms
+    short = (gaps > 0) & (gaps < max_gap)
+    for start, gap in zip(indices[:-1][short], gaps[short]):
+        keep[start + 1:start + 1 + gap] = True
+
+    mask = np.repeat(keep, frame)
+    # O resto que não completa um quadro segue a decisão do último quadro
+    mask = np.concatenate([mask, np.full(len(audio) - len(mask), keep[-1])])
+    trimmed = audio[mask]
+
+    removido = (len(audio) - len(trimmed)) / sample_rate
+    logger.info(
+        f"VAD removeu {removido:.1f}s de silêncio de {len(audio) / sample_rate:.1f}s "
+        f"({100 * (1 - len(trimmed) / len(audio)):.0f}%)"
+    )
+    return trimmed
+
+def download_audio(url, timeout=30):
+    """Baixa o áudio para a memória e retorna os bytes, ou None em caso de erro"""
+    try:
+        with _session.get(url, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                logger.error(f"Erro ao baixar áudio: status {response.status_code}")
+                return None
+            data = bytearray()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                data.extend(chunk)
+            return bytes(data)
+    except requests.RequestException as e:
+        logger.error(f"Erro ao baixar áudio: {e}")
+        return None
+
+def fetch_audio(url, sample_rate=SAMPLE_RATE, timeout=30):
+    """Baixa o áudio em streaming direto para o ffmpeg, sem arquivos temporários"""
+    try:
+        with _session.get(url, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                logger.error(f"Erro ao baixar áudio: status {response.status_code}")
+                return None
+            audio = decode_audio(response.iter_content(CHUNK_SIZE), sample_rate)
+    except requests.RequestException as e:
+        logger.error(f"Erro ao baixar áudio: {e}")
+        return None
+    if audio is not None:
+        logger.info(f"Áudio decodificado: {len(audio) / sample_rate:.1f}s")
+    return audio
@@ -0,0 +1,199 @@
+# modules/backends.py
+import csv
+import json
+import os
+import re
+import threading
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+SPREADSHEET_ID = "1vKrmgkMTDwcx5qufF-YRvsXSk99J1Vq9-LwuQINwcl8"
+GOOGLE_SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+DEFAULT_HEADERS = ["Data", "Categoria", "Descrição", "Responsável", "Valor"]
+
+def _column_index(letters):
+    index = 0
+    for ch in letters.upper():
+        index = index * 26 + (ord(ch) - 64)
+    return index
+
+class InMemoryWorksheet:
+    """Aba de planilha em memória com a mesma interface usada do gspread.Worksheet"""
+
+    def __init__(self, rows=None, title="Sheet1", headers=None):
+        self.title = title
+        self._lock = threading.Lock()
+        self._rows = [list(r) for r in rows] if rows else []
+        if not self._rows and headers:
+            self._rows.append(list(headers))
+
+    def _trim(self, row):
+        row = ["" if v is None else str(v) for v in row]
+        while row and row[-1] == "":
+            row.pop()
+        return row
+
+    def get_all_values(self):
+        with self._lock:
+            return [self._trim(r) for r in self._rows]
+
+    def get_all_records(self):
+        with self._lock:
+            if not self._rows:
+                return []
+            headers = self._rows[0]
+            return [dict(zip(headers, list(r) + [""] * (len(headers) - len(r)))) for r in self._rows[1:]]
+
+    def get(self, range_name):
+        """Suporta intervalos no formato A1 como 'A5:F' ou 'A5:F10'"""
+        match = re.fullmatch(r"([A-Za-z]+)(\d+)(?::([A-Za-z]+)(\d+)?)?", range_name)
+        if not match:
+            raise ValueError(f"Intervalo não suportado: {range_name}")
+        first_col = _column_index(match.group(1)) - 1
+        first_row = int(match.group(2)) - 1
+        last_col = _column_index(match.group(3)) if match.group(3) else first_col + 1
+        last_row = int(match.group(4)) if match.group(4) else None
+        with self._lock:
+            rows = self._rows[first_row:last_row]
+            return [self._trim(r[first_col:last_col]) for r in rows]
+
+    def row_values(self, row):
+        with self._lock:
+            return self._trim(self._rows[row - 1]) if row <= len(self._rows) else []
+
+    def col_values(self, col):
+        with self._lock:
+            return [r[col - 1] if len(r) >= col else "" for r in self._rows]
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        with self._lock:
+            self._rows.extend([str(v) for v in row] for row in values)
+
+    def replace_rows(self, rows):
+        """Substitui todo o conteúdo da aba (útil para gerar planilhas sintéticas)"""
+        with self._lock:
+            self._rows = [list(r) for r in rows]
+
+class FileWorksheet(InMemoryWorksheet):
+    """Aba de planilha persistida em um arquivo CSV local"""
+
+    def __init__(self, path, title="Sheet1", headers=None):
+        self.path = path
+        rows = []
+        if os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                rows = list(csv.reader(f))
+        super().__init__(rows, title=title, headers=headers)
+        if not rows and headers:
+            self._save()
+
+    def _save(self):
+        with open(self.path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(self._rows)
+
+    def append_rows(self, values, **kwargs):
+        super().append_rows(values, **kwargs)
+        with self._lock:
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows([str(v) for v in row] for row in values)
+
+    def replace_rows(self, rows):
+        super().replace_rows(rows)
+        with self._lock:
+            self._save()
+
+class InMemorySpreadsheet:
+    """Planilha em memória (várias abas) com a interface usada do gspread.Spreadsheet"""
+
+    def __init__(self):
+        self._worksheets = {}
+        self.sheet1 = self.add_worksheet("Sheet1")
+
+    def worksheets(self):
+        return list(self._worksheets.values())
+
+    def worksheet(self, title):
+        return self._worksheets[title]
+
+    def add_worksheet(self, title, rows=1000, cols=10):
+        worksheet = InMemoryWorksheet(title=title)
+        self._worksheets[title] = worksheet
+        return worksheet
+
+class _RecordedMessage:
+    def __init__(self, sid, **kwargs):
+        self.sid = sid
+        self.status = "queued"
+        self.body = kwargs.get("body")
+        self.to = kwargs.get("to")
+        self.from_ = kwargs.get("from_")
+        self.media_url = kwargs.get("media_url")
+
+class RecordingMessageSink:
+    """Substituto do twilio Client: registra as mensagens em vez de enviá-las"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = []
+        self.messages = self
+
+    def create(self, **kwargs):
+        message = _RecordedMessage(f"SM{uuid.uuid4().hex}", **kwargs)
+        with self._lock:
+            self.sent.append(kwargs)
+        logger.debug(f"Mensagem registrada para {kwargs.get('to')}: {kwargs.get('body')}")
+        return message
+
+    def clear(self):
+        with self._lock:
+            self.sent = []
+
+def sheets_backend():
+    return os.environ.get("SHEETS_BACKEND", "google").lower()
+
+def open_google_sheet():
+    """Autentica no Google Sheets e abre a primeira aba da planilha.
+
+    Retorna (aba, credenciais, sessão HTTP autenticada).
+    """
+    import gspread
+    from google.oauth2.service_account import Credentials
+    from google.auth.transport.requests import AuthorizedSession
+
+    creds = Credentials.from_service_account_info(json.loads(os.environ.get("GOOGLE_CREDS_JSON")), scopes=GOOGLE_SCOPE)
+    session = AuthorizedSession(creds)
+    client = gspread.authorize(creds, session=session)
+    spreadsheet = client.open_by_key(os.environ.get("SHEET_ID", SPREADSHEET_ID))
+    return spreadsheet.sheet1, creds, session
+
+def create_sheet():
+    """Cria a aba de despesas conforme SHEETS_BACKEND: google (padrão), memory ou file"""
+    backend = sheets_backend()
+    if backend == "memory":
+        logger.info("Usando planilha em memória")
+        return InMemoryWorksheet(headers=DEFAULT_HEADERS)
+    if backend == "file":
+        path = os.environ.get("SHEETS_FILE", "despesas.csv")
+        logger.info(f"Usando planilha local em {path}")
+        return FileWorksheet(path, headers=DEFAULT_HEADERS)
+    return open_google_sheet()[0]
+
+def create_twilio_client():
+    """Cria o cliente de mensagens conforme TWILIO_BACKEND: twilio (padrão) ou recording"""
+    backend = os.environ.get("TWILIO_BACKEND", "twilio").lower()
+    if backend == "recording":
+        logger.info("Usando cliente de mensagens que apenas registra os envios")
+        return RecordingMessageSink()
+    from twilio.rest import Client
+    from twilio.http.http_client import TwilioHttpClient
+    # Uma sessão HTTP com pool de conexões, reutilizada por todas as mensagens
+    return Client(
+        os.environ.get("TWILIO_SID"),
+        os.environ.get("TWILIO_TOKEN"),
+        http_client=TwilioHttpClient(pool_connections=True)
+    )
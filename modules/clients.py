@@ -0,0 +1,85 @@
+# modules/clients.py
+import os
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from modules.backends import sheets_backend, open_google_sheet, create_sheet, create_twilio_client
+
+logger = logging.getLogger(__name__)
+
+class LazyProxy:
+    """Objeto que só cria o cliente real no primeiro acesso a um atributo"""
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+
+    def __getattr__(self, name):
+        return getattr(self._factory(), name)
+
+class ClientProvider:
+    """Clientes do Google Sheets e do Twilio criados sob demanda e compartilhados no processo.
+
+    Nada é conectado na importação: a primeira chamada cria o cliente e as
+    seguintes reutilizam a mesma sessão HTTP. O token do Google é renovado
+    antes de expirar (refresh_margin), para que nenhuma requisição pague a
+    renovação. Depois de um fork (workers do gunicorn), os clientes são recriados.
+    """
+
+    def __init__(self, refresh_margin=timedelta(minutes=5)):
+        self.refresh_margin = refresh_margin
+        self._lock = threading.RLock()
+        self._reset()
+        self.sheet = LazyProxy(self.get_sheet)
+        self.twilio = LazyProxy(self.get_twilio)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._sheet = None
+        self._credentials = None
+        self._session = None
+        self._twilio = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            logger.info("Processo filho detectado, recriando clientes")
+            self._reset()
+
+    def get_sheet(self):
+        with self._lock:
+            self._check_pid()
+            if self._sheet is None:
+                if sheets_backend() == "google":
+                    logger.info("Conectando ao Google Sheets")
+                    self._sheet, self._credentials, self._session = open_google_sheet()
+                else:
+                    self._sheet = create_sheet()
+            else:
+                self.refresh_credentials()
+            return self._sheet
+
+    def get_twilio(self):
+        with self._lock:
+            self._check_pid()
+            if self._twilio is None:
+                self._twilio = create_twilio_client()
+            return self._twilio
+
+    def refresh_credentials(self):
+        """Renova o token do Google se ele expira dentro de refresh_margin"""
+        with self._lock:
+            creds = self._credentials
+            if creds is None:
+                return
+            expiry = creds.expiry
+            agora = datetime.now(timezone.utc).replace(tzinfo=None)
+            if expiry is not None and creds.token and expiry - agora > self.refresh_margin:
+                return
+            try:
+                from google.auth.transport.requests import Request
+                creds.refresh(Request(session=self._session))
+                logger.info(f"Token do Google renovado, expira em {creds.expiry}")
+            except Exception as e:
+                logger.error(f"Erro ao renovar token do Google: {e}")
+
+# Clientes compartilhados por app.py e pelo despachante de mensagens
+provider = ClientProvider()
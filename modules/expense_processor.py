@@ -2,6 +2,7 @@
 import re
 from datetime import datetime
 import logging
+from utils.money import parse_brl_cents
 
 logger = logging.getLogger(__name__)
 
@@ -68,12 +69,10 @@ class ExpenseProcessor:
                     categoria = categoria_texto.upper()
                 
                 # Limpar valor
-                try:
-                    valor_limpo = re.sub(r'[^\d.,]', '', valor)
-                    valor_limpo = valor_limpo.replace(',', '.')
-                    valor_float = float(valor_limpo)
-                except:
+                valor_cents = parse_brl_cents(valor, default=None)
+                if valor_cents is None:
                     return None
+                valor_float = valor_cents / 100
                 
                 return {
                     "date": data_formatada,
@@ -6,31 +6,41 @@ import os
 import json
 import logging
 from datetime import datetime
+from modules.ledger_cache import LedgerCache
+from utils.money import parse_brl_cents_array, format_brl, to_cents
 
 logger = logging.getLogger(__name__)
 
 class GoogleSheetsManager:
-    def __init__(self):
+    def __init__(self, spreadsheet=None):
         try:
-            # Inicializar conexão com Google Sheets
-            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            
-            # Obter credenciais do ambiente (mais seguro que hardcoded)
-            json_creds = os.environ.get("GOOGLE_CREDS_JSON")
-            if not json_creds:
-                raise ValueError("Credenciais do Google não encontradas nas variáveis de ambiente")
+            if spreadsheet is None:
+                # Inicializar conexão com Google Sheets
+                scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
                 
-            creds_dict = json.loads(json_creds)
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-            self.client = gspread.authorize(creds)
-            
-            # Abrir planilha
-            sheet_id = os.environ.get("SHEET_ID", "1vKrmgkMTDwcx5qufF-YRvsXSk99J1Vq9-LwuQINwcl8")
-            self.spreadsheet = self.client.open_by_key(sheet_id)
+                # Obter credenciais do ambiente (mais seguro que hardcoded)
+                json_creds = os.environ.get("GOOGLE_CREDS_JSON")
+                if not json_creds:
+                    raise ValueError("Credenciais do Google não encontradas nas variáveis de ambiente")
+                    
+                creds_dict = json.loads(json_creds)
+                creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+                self.client = gspread.authorize(creds)
+                
+                # Abrir planilha
+                sheet_id = os.environ.get("SHEET_ID", "1vKrmgkMTDwcx5qufF-YRvsXSk99J1Vq9-LwuQINwcl8")
+                spreadsheet = self.client.open_by_key(sheet_id)
+            else:
+                # Planilha já aberta (ex.: InMemorySpreadsheet em benchmarks)
+                self.client = None
+            self.spreadsheet = spreadsheet
             
             # Garantir que as abas necessárias existam
             self._ensure_worksheets_exist()
             
+            # Cópia local da aba de despesas, sincronizada de forma incremental
+            self.expenses = LedgerCache(self.spreadsheet.worksheet("Despesas"), buffered=True)
+            
             logger.info("Conexão com Google Sheets estabelecida com sucesso")
         except Exception as e:
             logger.error(f"Erro ao inicializar Google Sheets: {str(e)}")
@@ -59,14 +69,18 @@ class GoogleSheetsManager:
                         ["MORADIA", "aluguel, condominio, energia, água, internet, luz"],
                         ["REFEIÇÃO", "restaurante, lanche, jantar, almoço, hamburguer, pizza"]
                     ]
-                    for category in categories:
-                        self.spreadsheet.worksheet(sheet_name).append_row(category)
+                    self.spreadsheet.worksheet(sheet_name).append_rows(categories)
+    
+    def sync_expenses(self, full=False):
+        """Sincroniza a cópia local de despesas (apenas linhas novas, ou tudo se full=True)"""
+        if full:
+            self.expenses.reconcile()
+        else:
+            self.expenses.sync()
     
     def add_expense(self, expense_data):
         """Adiciona uma nova despesa à planilha"""
         try:
-            sheet = self.spreadsheet.worksheet("Despesas")
-            
             # Formatar dados para inserção
             date = expense_data.get("date", datetime.now().strftime("%d/%m/%Y"))
             category = expense_data.get("category", "OUTROS")
@@ -75,7 +89,7 @@ class GoogleSheetsManager:
             # Formatar valor como moeda
             try:
                 amount = float(expense_data.get("amount", 0))
-                formatted_amount = f"R${amount:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+                formatted_amount = format_brl(to_cents(amount))
             except:
                 formatted_amount = str(expense_data.get("amount", "0"))
             
@@ -87,7 +101,7 @@ class GoogleSheetsManager:
             
             # Adicionar linha à planilha
             row = [date, category, description, formatted_amount, user, timestamp]
-            sheet.append_row(row)
+            self.expenses.append_row(row).result(timeout=30)
             
             logger.info(f"Despesa adicionada com sucesso: {row}")
             return {"success": True}
@@ -95,87 +109,65 @@ class GoogleSheetsManager:
             logger.error(f"Erro ao adicionar despesa: {str(e)}")
             return {"success": False, "error": str(e)}
     
-    def get_expenses(self, filters=None):
+    def get_expenses(self, filters=None, include_records=True):
         """Obtém despesas da planilha com filtros opcionais"""
         try:
-            sheet = self.spreadsheet.worksheet("Despesas")
-            data = sheet.get_all_records()
+            data = self.expenses.get_all_records()
             
             # Converter para DataFrame para facilitar análise
             df = pd.DataFrame(data)
             
             # Se não houver dados
             if df.empty:
-                return {"success": True, "data": [], "total": 0}
+                return {"success": True, "data": [], "total": 0, "category_totals": {}, "user_totals": {}}
+            
+            # Converter valor (em centavos) e data uma única vez
+            valores = pd.Series(parse_brl_cents_array(df["Valor"]), index=df.index)
+            datas = pd.to_datetime(df["Data"], format="%d/%m/%Y", errors="coerce")
             
             # Aplicar filtros se existirem
+            mask = pd.Series(True, index=df.index)
             if filters:
                 # Filtro por mês
                 if "month" in filters:
-                    df["Data"] = pd.to_datetime(df["Data"], format="%d/%m/%Y", errors="coerce")
-                    df = df[df["Data"].dt.month == filters["month"]]
+                    mask &= datas.dt.month == filters["month"]
                 
                 # Filtro por usuário
                 if "user" in filters:
-                    df = df[df["Responsável"] == filters["user"].upper()]
+                    mask &= df["Responsável"] == filters["user"].upper()
                 
                 # Filtro por categoria
                 if "category" in filters:
-                    df = df[df["Categoria"] == filters["category"].upper()]
+                    mask &= df["Categoria"] == filters["category"].upper()
                 
                 # Filtro por data inicial e final
                 if "start_date" in filters and "end_date" in filters:
-                    df["Data"] = pd.to_datetime(df["Data"], format="%d/%m/%Y", errors="coerce")
                     start = pd.to_datetime(filters["start_date"], format="%d/%m/%Y")
                     end = pd.to_datetime(filters["end_date"], format="%d/%m/%Y")
-                    df = df[(df["Data"] >= start) & (df["Data"] <= end)]
-            
-            # Calcular totais
-            total = 0
-            for valor in df["Valor"]:
-                try:
-                    # Extrair valor numérico de strings como "R$123,45"
-                    valor_limpo = valor.replace("R$", "").replace(".", "").replace(",", ".")
-                    total += float(valor_limpo)
-                except:
-                    pass
-            
-            # Agrupar por categoria
-            category_totals = {}
-            for cat in df["Categoria"].unique():
-                cat_total = 0
-                for valor in df[df["Categoria"] == cat]["Valor"]:
-                    try:
-                        valor_limpo = valor.replace("R$", "").replace(".", "").replace(",", ".")
-                        cat_total += float(valor_limpo)
-                    except:
-                        pass
-                category_totals[cat] = cat_total
-            
-            # Agrupar por responsável
-            user_totals = {}
-            for user in df["Responsável"].unique():
-                user_total = 0
-                for valor in df[df["Responsável"] == user]["Valor"]:
-                    try:
-                        valor_limpo = valor.replace("R$", "").replace(".", "").replace(",", ".")
-                        user_total += float(valor_limpo)
-                    except:
-                        pass
-                user_totals[user] = user_total
-            
-            return {
+                    mask &= (datas >= start) & (datas <= end)
+            
+            df = df[mask]
+            valores = valores[mask]
+            
+            # Calcular totais agrupando uma única vez por categoria e por responsável
+            result = {
                 "success": True,
-                "data": df.to_dict("records"),
-                "total": total,
-                "category_totals": category_totals,
-                "user_totals": user_totals
+                "total": int(valores.sum()) / 100,
+                "category_totals": (valores.groupby(df["Categoria"], sort=False).sum() / 100).to_dict(),
+                "user_totals": (valores.groupby(df["Responsável"], sort=False).sum() / 100).to_dict()
             }
+            if include_records:
+                result["data"] = df.to_dict("records")
+            return result
             
         except Exception as e:
             logger.error(f"Erro ao obter despesas: {str(e)}")
             return {"success": False, "error": str(e)}
     
+    def get_expense_totals(self, filters=None):
+        """Obtém apenas os totais (geral, por categoria e por responsável), sem a lista de registros"""
+        return self.get_expenses(filters, include_records=False)
+    
     def get_categories(self):
         """Obtém as categorias e suas palavras-chave da planilha"""
         try:
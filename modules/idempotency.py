@@ -0,0 +1,139 @@
+# modules/idempotency.py
+import json
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class IdempotencyCache:
+    """Cache limitado com TTL para deduplicar mensagens pelo MessageSid do Twilio.
+
+    Mantém até max_entries chaves em memória (LRU). Se spill_path for informado,
+    as entradas também são gravadas em um SQLite local, o que preserva a
+    deduplicação entre reinícios e entre workers do mesmo servidor.
+
+    Reservas em andamento (claim) valem só por um prazo curto (lease), em
+    memória e no SQLite, renovável com renew() enquanto o trabalho anda: se o
+    worker ou o processo morrer antes do put(), a próxima tentativa do Twilio,
+    passado o prazo, consegue reservar a chave de novo e a mensagem é
+    reprocessada.
+    """
+
+    def __init__(self, ttl=3600, max_entries=10000, spill_path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.spill_path = spill_path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        if spill_path:
+            try:
+                self._db = sqlite3.connect(spill_path, check_same_thread=False, isolation_level=None)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+                )
+                self._db.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+            except Exception as e:
+                logger.error(f"Erro ao abrir cache de deduplicação em {spill_path}: {e}")
+                self._db = None
+
+    def _remember(self, key, value, expires):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_locked(self, key):
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] >= now:
+                self._entries.move_to_end(key)
+                return entry[0]
+            del self._entries[key]
+        if self._db is not None:
+            row = self._db.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and row[1] >= now:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                return value
+        return None
+
+    def get(self, key):
+        """Retorna o valor guardado para a chave, ou None se não existir/expirou"""
+        with self._lock:
+            return self._get_locked(key)
+
+    def put(self, key, value):
+        """Guarda (ou substitui) o valor da chave, renovando o TTL"""
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, value, expires)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires)
+                    )
+                except Exception as e:
+                    logger.error(f"Erro ao gravar cache de deduplicação: {e}")
+
+    def claim(self, key, value, lease=None):
+        """Reserva a chave se ela ainda não existe.
+
+        Retorna (True, None) se a reserva foi feita, ou (False, valor_existente)
+        se a chave já estava no cache. Com `lease`, a reserva expira em `lease`
+        segundos (a menos que seja renovada ou concluída com put()).
+        """
+        expires = time.time() + (lease or self.ttl)
+        with self._lock:
+            existing = self._get_locked(key)
+            if existing is not None:
+                return False, existing
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM entries WHERE key = ? AND expires < ?", (key, time.time()))
+                    cursor = self._db.execute(
+                        "INSERT OR IGNORE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires)
+                    )
+                    if cursor.rowcount == 0:
+                        # Outro worker reservou a chave entre a leitura e a gravação
+                        return False, self._get_locked(key) or value
+                except Exception as e:
+                    logger.error(f"Erro ao reservar chave no cache de deduplicação: {e}")
+            self._remember(key, value, expires)
+            return True, None
+
+    def renew(self, key, lease):
+        """Estende a reserva da chave por mais `lease` segundos a partir de agora.
+
+        Retorna False se a chave já expirou ou foi removida (outra tentativa pode
+        tê-la reservado).
+        """
+        expires = time.time() + lease
+        with self._lock:
+            value = self._get_locked(key)
+            if value is None:
+                return False
+            if expires > self._entries[key][1]:
+                self._remember(key, value, expires)
+                if self._db is not None:
+                    try:
+                        self._db.execute("UPDATE entries SET expires = MAX(expires, ?) WHERE key = ?", (expires, key))
+                    except Exception as e:
+                        logger.error(f"Erro ao renovar chave no cache de deduplicação: {e}")
+            return True
+
+    def discard(self, key):
+        """Remove a chave (ex.: quando a mensagem não pôde ser enfileirada)"""
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                try:
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                except Exception as e:
+                    logger.error(f"Erro ao remover chave do cache de deduplicação: {e}")
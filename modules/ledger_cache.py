@@ -0,0 +1,239 @@
+# modules/ledger_cache.py
+import hashlib
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from modules.write_buffer import WriteBuffer
+
+logger = logging.getLogger(__name__)
+
+def _column_letter(index):
+    """Converte índice de coluna (1 = A) na letra usada em intervalos A1"""
+    letters = ""
+    while index > 0:
+        index, resto = divmod(index - 1, 26)
+        letters = chr(65 + resto) + letters
+    return letters or "A"
+
+def _trim_row(row):
+    """Remove células vazias no fim da linha (a API omite essas células)"""
+    row = [str(v) for v in row]
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+class LedgerCache:
+    """Cópia local da planilha de despesas, mantida em sincronia com a aba do Google Sheets.
+
+    As escritas passam pela planilha e pela cópia local (write-through); uma
+    reconciliação periódica (reconcile) recarrega tudo para capturar edições
+    feitas diretamente na planilha. Entre reconciliações, sync() confere uma
+    assinatura da coluna de valores (quantidade de linhas + checksum) e busca
+    apenas as linhas novas, ou recarrega tudo se ela mudou. Com buffered=True,
+    as gravações são agrupadas em um WriteBuffer e enviadas com append_rows.
+    """
+
+    def __init__(self, worksheet, sync_interval=30, buffered=False, max_batch_rows=20, flush_interval=0.5,
+                 value_column="Valor"):
+        self.worksheet = worksheet
+        self.sync_interval = sync_interval
+        self.value_column = value_column
+        self._lock = threading.RLock()
+        # Serializa gravações e leituras na planilha (sempre adquirido antes de _lock)
+        self._write_lock = threading.RLock()
+        self._headers = []
+        self._records = []
+        self._last_row = []
+        self._value_hash = hashlib.sha1()
+        self._loaded = False
+        self.last_reconcile = None
+        self.last_sync = None
+        self._syncing = False
+        self._listeners = []
+        self.write_buffer = None
+        if buffered:
+            self.write_buffer = WriteBuffer(self._write_rows, max_rows=max_batch_rows, flush_interval=flush_interval)
+
+    def _to_record(self, row):
+        """Converte uma linha (lista) em dicionário usando os cabeçalhos"""
+        values = [str(v) for v in row]
+        values += [""] * (len(self._headers) - len(values))
+        return dict(zip(self._headers, values))
+
+    def _value_index(self):
+        """Posição (base 0) da coluna de valores; sem ela, a última coluna"""
+        if self.value_column in self._headers:
+            return self._headers.index(self.value_column)
+        return max(len(self._headers) - 1, 0)
+
+    @staticmethod
+    def _hash_values(digest, values):
+        for value in values:
+            digest.update(value.encode("utf-8") + b"\n")
+
+    def _track_values(self, records):
+        """Acrescenta os valores das novas linhas ao checksum local"""
+        header = self._headers[self._value_index()] if self._headers else ""
+        self._hash_values(self._value_hash, (record.get(header, "") for record in records))
+
+    def subscribe(self, listener):
+        """Registra um ouvinte com reset(records) e extend(records), chamados a cada recarga/nova linha"""
+        with self._lock:
+            self._listeners.append(listener)
+            if self._loaded:
+                listener.reset(list(self._records))
+
+    def _notify_reset(self):
+        for listener in self._listeners:
+            listener.reset(self._records)
+
+    def _notify_extend(self, records):
+        if records:
+            for listener in self._listeners:
+                listener.extend(records)
+
+    def reconcile(self):
+        """Recarrega todas as linhas da planilha, substituindo a cópia local"""
+        try:
+            inicio = time.time()
+            with self._write_lock:
+                values = self.worksheet.get_all_values()
+                with self._lock:
+                    self._headers = values[0] if values else []
+                    self._records = [self._to_record(row) for row in values[1:]]
+                    self._last_row = _trim_row(values[-1]) if values else []
+                    # O checksum cobre o cabeçalho e todas as linhas, como col_values()
+                    self._value_hash = hashlib.sha1()
+                    self._hash_values(self._value_hash, [self._headers[self._value_index()] if self._headers else ""])
+                    self._track_values(self._records)
+                    self._loaded = True
+                    self.last_reconcile = self.last_sync = time.time()
+                    self._notify_reset()
+            logger.info(f"Cache local reconciliado: {len(self._records)} registros em {time.time() - inicio:.2f}s")
+        except Exception as e:
+            logger.error(f"Erro ao reconciliar cache local: {e}")
+            if not self._loaded:
+                raise
+
+    def sync(self):
+        """Busca apenas as linhas adicionadas desde a última sincronização.
+
+        Lê só a coluna de valores e compara a quantidade de linhas e o checksum
+        das já conhecidas com a cópia local: se algo mudou (valor editado, linha
+        removida ou inserida no meio por outro processo), faz uma releitura
+        completa. Se só há linhas novas, busca apenas elas, a partir da última
+        linha conhecida, que também precisa bater com a cópia local.
+        """
+        if not self._loaded:
+            self.reconcile()
+            return
+
+        with self._write_lock:
+            with self._lock:
+                last_row = len(self._records) + 1
+                last_col = _column_letter(max(len(self._headers), 1))
+                value_col = self._value_index() + 1
+                anchor = list(self._last_row)
+                local_hash = self._value_hash.hexdigest()
+
+            try:
+                column = [str(v) for v in self.worksheet.col_values(value_col)]
+            except Exception as e:
+                logger.error(f"Erro na sincronização incremental: {e}")
+                return
+
+            # A API omite células vazias no fim da coluna
+            known = column[:last_row] + [""] * (last_row - len(column))
+            remote_hash = hashlib.sha1()
+            self._hash_values(remote_hash, known)
+            if remote_hash.hexdigest() != local_hash:
+                logger.info("Coluna de valores alterada desde a última sincronização, recarregando tudo")
+                self.reconcile()
+                return
+            if len(column) <= last_row:
+                with self._lock:
+                    self.last_sync = time.time()
+                return
+
+            try:
+                rows = self.worksheet.get(f"A{last_row}:{last_col}")
+            except Exception as e:
+                logger.error(f"Erro na sincronização incremental: {e}")
+                return
+
+            rows = [_trim_row(row) for row in rows]
+            if not rows or rows[0] != anchor:
+                logger.info("Planilha alterada desde a última sincronização, recarregando tudo")
+                self.reconcile()
+                return
+
+            with self._lock:
+                new_records = [self._to_record(row) for row in rows[1:]]
+                self._records.extend(new_records)
+                self._track_values(new_records)
+                if new_records:
+                    self._last_row = rows[-1]
+                self.last_sync = time.time()
+                self._notify_extend(new_records)
+        if len(rows) > 1:
+            logger.info(f"Sincronização incremental: {len(rows) - 1} novas linhas")
+
+    def _background_sync(self):
+        try:
+            self.sync()
+        except Exception as e:
+            logger.error(f"Erro na sincronização em segundo plano: {e}")
+        finally:
+            with self._lock:
+                self._syncing = False
+
+    def refresh(self):
+        """Carrega a cópia local na primeira chamada (bloqueando); depois, se ela
+        estiver desatualizada, dispara sync() em segundo plano e segue com a
+        cópia local, sem esperar a API do Google na leitura.
+        """
+        if not self._loaded:
+            self.reconcile()
+            return
+        with self._lock:
+            if self._syncing or time.time() - self.last_sync <= self.sync_interval:
+                return
+            self._syncing = True
+        threading.Thread(target=self._background_sync, name="ledger-sync", daemon=True).start()
+
+    def get_all_records(self):
+        """Retorna os registros a partir da cópia local (mesmo formato de get_all_records)"""
+        self.refresh()
+        with self._lock:
+            return list(self._records)
+
+    def _write_rows(self, rows):
+        """Grava as linhas na planilha com uma única chamada e atualiza a cópia local"""
+        with self._write_lock:
+            self.worksheet.append_rows(rows)
+            with self._lock:
+                if self._loaded:
+                    new_records = [self._to_record(row) for row in rows]
+                    self._records.extend(new_records)
+                    self._track_values(new_records)
+                    self._last_row = _trim_row(rows[-1])
+                    self._notify_extend(new_records)
+
+    def append_row(self, row):
+        """Grava a linha na planilha e na cópia local.
+
+        Retorna um Future concluído quando a linha foi gravada; sem buffer, a
+        gravação acontece na hora.
+        """
+        if self.write_buffer:
+            return self.write_buffer.append_row(row)
+        future = Future()
+        self._write_rows([row])
+        future.set_result(True)
+        return future
+
+    def flush(self):
+        """Grava imediatamente as linhas pendentes no buffer"""
+        if self.write_buffer:
+            self.write_buffer.flush()
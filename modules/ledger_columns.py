@@ -0,0 +1,167 @@
+# modules/ledger_columns.py
+import threading
+import logging
+from bisect import bisect_left, bisect_right
+import numpy as np
+from modules.ledger_rollups import _parse_ordinal
+from utils.money import parse_brl_cents_array
+
+logger = logging.getLogger(__name__)
+
+class ColumnarLedger:
+    """Representação em colunas NumPy dos registros do LedgerCache.
+
+    Cada linha vira valores em centavos (int64), ordinal da data (int32, 0 quando
+    a data é inválida) e códigos inteiros para categoria e responsável. As
+    colunas ficam ordenadas pela data, com um índice secundário por
+    responsável, então um período é localizado por busca binária e agregado
+    com np.bincount.
+    """
+
+    def __init__(self, ledger, initial_capacity=1024):
+        self.ledger = ledger
+        self._lock = threading.RLock()
+        self._initial_capacity = initial_capacity
+        self._clear()
+        ledger.subscribe(self)
+
+    def _clear(self):
+        capacity = self._initial_capacity
+        self._size = 0
+        self._cents = np.zeros(capacity, dtype=np.int64)
+        self._ordinals = np.zeros(capacity, dtype=np.int32)
+        self._category_codes = np.zeros(capacity, dtype=np.int32)
+        self._resp_codes = np.zeros(capacity, dtype=np.int32)
+        self.categories = []
+        self._category_index = {}
+        self.responsaveis = []
+        self._resp_index = {}
+        # {código do responsável: ([posições], [ordinais])}, em ordem de data
+        self._by_resp = {}
+        self._resp_dirty = False
+
+    @staticmethod
+    def _code(value, names, index):
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(names)
+            names.append(value)
+        return code
+
+    def _grow(self, needed):
+        capacity = len(self._cents)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("_cents", "_ordinals", "_category_codes", "_resp_codes"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def _encode(self, records):
+        cents = parse_brl_cents_array([record.get("Valor", "0") for record in records])
+        ordinals, cats, resps = [], [], []
+        for record in records:
+            ordinals.append(_parse_ordinal(record.get("Data", "")) or 0)
+            cats.append(self._code(record.get("Categoria", "OUTROS"), self.categories, self._category_index))
+            resps.append(self._code(record.get("Responsável", "").strip().upper(), self.responsaveis, self._resp_index))
+        return cents, ordinals, cats, resps
+
+    def _append_columns(self, cents, ordinals, cats, resps):
+        start = self._size
+        end = start + len(cents)
+        if end == start:
+            return
+        self._grow(end)
+
+        novos = np.asarray(ordinals, dtype=np.int32)
+        em_ordem = bool(np.all(novos[1:] >= novos[:-1])) and (start == 0 or novos[0] >= self._ordinals[start - 1])
+        if not em_ordem:
+            # Despesa com data retroativa: cada linha nova entra logo depois das já
+            # existentes com a mesma data (busca binária), sem reordenar o histórico
+            ordem = np.argsort(novos, kind="stable")
+            destinos = np.searchsorted(self._ordinals[:start], novos[ordem], side="right")
+            for name, valores in (("_cents", cents), ("_ordinals", novos),
+                                  ("_category_codes", cats), ("_resp_codes", resps)):
+                coluna = getattr(self, name)
+                coluna[:end] = np.insert(coluna[:start], destinos, np.asarray(valores)[ordem])
+            self._size = end
+            self._resp_dirty = True
+            return
+
+        self._cents[start:end] = cents
+        self._ordinals[start:end] = novos
+        self._category_codes[start:end] = cats
+        self._resp_codes[start:end] = resps
+        self._size = end
+        if not self._resp_dirty:
+            for pos in range(start, end):
+                positions, resp_ordinals = self._by_resp.setdefault(int(self._resp_codes[pos]), ([], []))
+                positions.append(pos)
+                resp_ordinals.append(int(self._ordinals[pos]))
+
+    def _resp_window_index(self, code):
+        """Índice secundário do responsável: (posições, ordinais), ambos ordenados por data"""
+        if self._resp_dirty:
+            n = self._size
+            ordem = np.argsort(self._resp_codes[:n], kind="stable")
+            codes = self._resp_codes[:n][ordem]
+            limites = np.flatnonzero(np.diff(codes)) + 1
+            self._by_resp = {}
+            for grupo in np.split(ordem, limites):
+                if len(grupo):
+                    self._by_resp[int(self._resp_codes[grupo[0]])] = (grupo.tolist(), self._ordinals[grupo].tolist())
+            self._resp_dirty = False
+        return self._by_resp.get(code, ([], []))
+
+    def reset(self, records):
+        """Reconstrói as colunas a partir dos registros (chamado pelo LedgerCache)"""
+        with self._lock:
+            self._clear()
+            self._append_columns(*self._encode(records))
+        logger.info(f"Colunas do ledger reconstruídas: {self._size} linhas")
+
+    def extend(self, records):
+        """Acrescenta novos registros às colunas (chamado pelo LedgerCache)"""
+        with self._lock:
+            self._append_columns(*self._encode(records))
+
+    def _window(self, start, end, responsavel):
+        """Linhas no período [start, end] via busca binária; retorna slice ou array de posições"""
+        n = self._size
+        resp = (responsavel or "TODOS").strip().upper()
+        sem_periodo = start is None and end is None
+        # Datas inválidas têm ordinal 0 e ficam no início; só entram quando não há período
+        start = 0 if sem_periodo else max(start or 1, 1)
+
+        if resp == "TODOS":
+            ordinals = self._ordinals[:n]
+            lo = int(np.searchsorted(ordinals, start, side="left"))
+            hi = n if end is None else int(np.searchsorted(ordinals, end, side="right"))
+            return slice(lo, max(lo, hi))
+
+        code = self._resp_index.get(resp)
+        if code is None:
+            return slice(0, 0)
+        positions, resp_ordinals = self._resp_window_index(code)
+        lo = bisect_left(resp_ordinals, start)
+        hi = len(resp_ordinals) if end is None else bisect_right(resp_ordinals, end)
+        return np.asarray(positions[lo:max(lo, hi)], dtype=np.intp)
+
+    def totals_by_category(self, start=None, end=None, responsavel="TODOS"):
+        """Totais por categoria no período [start, end] (ordinais; None = sem limite).
+
+        Retorna (categorias, total, quantidade), com valores em reais. O custo
+        depende do número de linhas no período, não do histórico inteiro.
+        """
+        self.ledger.refresh()
+        with self._lock:
+            window = self._window(start, end, responsavel)
+            cents = self._cents[window]
+            codes = self._category_codes[window]
+            por_categoria = np.bincount(codes, weights=cents, minlength=len(self.categories))
+            presentes = np.flatnonzero(np.bincount(codes, minlength=len(self.categories)))
+            categorias = {self.categories[int(code)]: float(por_categoria[code]) / 100 for code in presentes}
+            return categorias, int(cents.sum()) / 100, len(cents)
@@ -0,0 +1,136 @@
+# modules/ledger_rollups.py
+import threading
+import logging
+from datetime import datetime
+from functools import lru_cache
+from utils.money import parse_brl_cents, parse_brl_cents_array
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=8192)
+def _parse_ordinal(data_str):
+    """Converte a data da planilha em ordinal (dd/mm/aaaa ou aaaa-mm-dd); None se inválida.
+
+    A planilha tem poucas centenas de datas distintas para centenas de milhares
+    de linhas, então cada texto é convertido com strptime uma única vez.
+    """
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(data_str, fmt).toordinal()
+        except (ValueError, TypeError):
+            continue
+    return None
+
+@lru_cache(maxsize=8192)
+def _year_month_day(ordinal):
+    data = datetime.fromordinal(ordinal)
+    return data.year, data.month, data.day
+
+class LedgerRollups:
+    """Totais pré-agregados por dia/mês × categoria × responsável.
+
+    Os baldes são atualizados a cada nova linha do LedgerCache e reconstruídos
+    quando o cache é recarregado, então os resumos custam O(número de baldes)
+    em vez de uma varredura completa dos registros. Os totais são somados em
+    centavos e convertidos para reais apenas na saída.
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self._lock = threading.RLock()
+        self._clear()
+        ledger.subscribe(self)
+
+    def _clear(self):
+        # {(categoria, responsavel): [centavos, quantidade]}
+        self._overall = {}
+        # {ordinal: {(categoria, responsavel): [centavos, quantidade]}}
+        self._by_day = {}
+        # {(ano, mes): {dia: centavos}}
+        self._by_month = {}
+        self._max_ordinal = None
+
+    @staticmethod
+    def _add(buckets, key, valor):
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [valor, 1]
+        else:
+            bucket[0] += valor
+            bucket[1] += 1
+
+    def _add_record(self, record, valor=None):
+        if valor is None:
+            valor = parse_brl_cents(record.get("Valor", "0")) or 0
+        key = (record.get("Categoria", "OUTROS"), record.get("Responsável", "").strip().upper())
+        self._add(self._overall, key, valor)
+
+        ordinal = _parse_ordinal(record.get("Data", ""))
+        if ordinal is None:
+            return
+        self._add(self._by_day.setdefault(ordinal, {}), key, valor)
+        ano, mes, dia = _year_month_day(ordinal)
+        dias = self._by_month.setdefault((ano, mes), {})
+        dias[dia] = dias.get(dia, 0) + valor
+        if self._max_ordinal is None or ordinal > self._max_ordinal:
+            self._max_ordinal = ordinal
+
+    def reset(self, records):
+        """Reconstrói todos os baldes a partir dos registros (chamado pelo LedgerCache)"""
+        with self._lock:
+            self._clear()
+            # Valores repetidos são convertidos uma única vez
+            valores = parse_brl_cents_array([record.get("Valor", "0") for record in records])
+            for record, valor in zip(records, valores.tolist()):
+                self._add_record(record, valor)
+        logger.info(f"Totais agregados reconstruídos: {len(self._by_day)} dias, {len(self._overall)} grupos")
+
+    def extend(self, records):
+        """Soma novos registros aos baldes existentes (chamado pelo LedgerCache)"""
+        with self._lock:
+            for record in records:
+                self._add_record(record)
+
+    def rebuild(self):
+        """Relê a planilha e reconstrói os totais"""
+        self.ledger.reconcile()
+
+    def totals_by_category(self, start=None, end=None, responsavel="TODOS"):
+        """Totais por categoria no período [start, end] (ordinais; None = sem limite).
+
+        Retorna (categorias, total, quantidade).
+        """
+        self.ledger.refresh()
+        resp = (responsavel or "TODOS").strip().upper()
+        categorias = {}
+        total = 0
+        quantidade = 0
+
+        with self._lock:
+            if start is None and end is None:
+                grupos = [self._overall]
+            elif self._max_ordinal is None:
+                grupos = []
+            else:
+                if start is None:
+                    start = min(self._by_day)
+                if end is None:
+                    end = self._max_ordinal
+                grupos = [self._by_day[o] for o in range(start, end + 1) if o in self._by_day]
+
+            for buckets in grupos:
+                for (categoria, resp_registro), (valor, n) in buckets.items():
+                    if resp != "TODOS" and resp_registro != resp:
+                        continue
+                    categorias[categoria] = categorias.get(categoria, 0) + valor
+                    total += valor
+                    quantidade += n
+
+        categorias = {categoria: centavos / 100 for categoria, centavos in categorias.items()}
+        return categorias, total / 100, quantidade
+
+    def daily_totals(self, ano, mes):
+        """Totais por dia do mês informado: {dia: total}"""
+        self.ledger.refresh()
+        with self._lock:
+            return {dia: centavos / 100 for dia, centavos in self._by_month.get((ano, mes), {}).items()}
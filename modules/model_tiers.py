@@ -0,0 +1,78 @@
+# modules/model_tiers.py
+import os
+import logging
+from modules.transcription_service import service
+
+logger = logging.getLogger(__name__)
+
+class ModelTierPolicy:
+    """Escolhe o modelo Whisper conforme a duração do áudio e a carga do servidor.
+
+    `tiers` vai do menor para o maior modelo. Áudios curtos usam preferred_model
+    quando a fila de transcrição está vazia e a latência prevista cabe no
+    orçamento; caso contrário usa-se o primeiro (mais rápido) da lista.
+    """
+
+    def __init__(self, service, tiers=("tiny", "base"), preferred_model="base", short_clip_seconds=20,
+                 max_queue_depth=0, latency_budget=10.0):
+        self.service = service
+        self.tiers = list(tiers)
+        self.preferred_model = preferred_model if preferred_model in self.tiers else self.tiers[-1]
+        self.short_clip_seconds = short_clip_seconds
+        self.max_queue_depth = max_queue_depth
+        self.latency_budget = latency_budget
+
+    @property
+    def fast_model(self):
+        return self.tiers[0]
+
+    def predicted_latency(self, model_name, duration):
+        """Latência prevista pelo fator de tempo real observado; None se ainda não há medição"""
+        rtf = self.service.real_time_factor(model_name)
+        return rtf * duration if rtf is not None else None
+
+    def _fits(self, model_name, duration):
+        if self.service.pending() > self.max_queue_depth:
+            return False
+        previsto = self.predicted_latency(model_name, duration)
+        return previsto is None or previsto <= self.latency_budget
+
+    def choose(self, duration):
+        """Modelo para transcrever um áudio de `duration` segundos"""
+        if duration <= self.short_clip_seconds and self._fits(self.preferred_model, duration):
+            modelo = self.preferred_model
+        else:
+            modelo = self.fast_model
+        logger.info(
+            f"Modelo {modelo} para áudio de {duration:.1f}s "
+            f"(fila: {self.service.pending()}, orçamento: {self.latency_budget}s)"
+        )
+        return modelo
+
+    def upgrade(self, model_name, duration):
+        """Próximo modelo maior para tentar de novo, ou None se não houver ou não couber na carga"""
+        if model_name not in self.tiers:
+            return None
+        indice = self.tiers.index(model_name)
+        if indice + 1 >= len(self.tiers):
+            return None
+        maior = self.tiers[indice + 1]
+        return maior if self._fits(maior, duration) else None
+
+def _tiers_from_env():
+    tiers = [t.strip() for t in os.environ.get("WHISPER_TIERS", f"{service.model_name},base").split(",") if t.strip()]
+    # Remove repetidos mantendo a ordem (ex.: WHISPER_MODEL=base)
+    return list(dict.fromkeys(tiers))
+
+# Política compartilhada por app.py e SpeechProcessor
+policy = ModelTierPolicy(
+    service,
+    tiers=_tiers_from_env(),
+    preferred_model=os.environ.get("WHISPER_PREFERRED_MODEL", "base"),
+    short_clip_seconds=float(os.environ.get("TRANSCRIPTION_SHORT_CLIP_SECONDS", 20)),
+    max_queue_depth=int(os.environ.get("TRANSCRIPTION_UPGRADE_MAX_QUEUE", 0)),
+    latency_budget=float(os.environ.get("TRANSCRIPTION_LATENCY_BUDGET_SECONDS", 10))
+)
+# Todos os níveis são aquecidos nos workers: o preferred_model é a escolha
+# comum para notas curtas e não deve pagar o carregamento na primeira delas
+service.warm(policy.tiers)
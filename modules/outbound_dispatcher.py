@@ -0,0 +1,101 @@
+# modules/outbound_dispatcher.py
+import os
+import random
+import threading
+import time
+import logging
+from modules.clients import provider
+from modules.task_queue import WorkerPool, KeyedExecutor
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Limitador de taxa: `rate` envios por segundo com rajadas de até `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Bloqueia até haver um token disponível"""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (agora - self._updated) * self.rate)
+                self._updated = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                espera = (1 - self._tokens) / self.rate
+            time.sleep(espera)
+
+def _status_code(error):
+    return getattr(error, "status", None) or getattr(error, "status_code", None)
+
+class OutboundDispatcher:
+    """Ponto único de envio de mensagens pelo Twilio.
+
+    - respeita o limite de mensagens por segundo do número (TokenBucket);
+    - repete respostas 429 e 5xx com backoff exponencial e jitter;
+    - envia para destinatários diferentes em paralelo, mantendo a ordem por destinatário.
+
+    O cliente Twilio deve usar uma sessão HTTP com pool de conexões
+    (ver modules.backends.create_twilio_client).
+    """
+
+    def __init__(self, client, from_number, rate=1.0, burst=5, max_retries=4, base_delay=1.0,
+                 workers=4, max_pending=200):
+        self.client = client
+        self.from_number = from_number
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.bucket = TokenBucket(rate, burst)
+        self._executor = KeyedExecutor(WorkerPool(workers, max_pending, name="twilio-out"), max_pending=max_pending)
+
+    def send(self, to, body=None, media_url=None):
+        """Enfileira uma mensagem para `to` e retorna um Future com a mensagem criada"""
+        dados = {"from_": self.from_number, "to": to}
+        if body is not None:
+            dados["body"] = body
+        if media_url:
+            dados["media_url"] = media_url if isinstance(media_url, list) else [media_url]
+        future = self._executor.submit(to, self._deliver, dados)
+        if future is None:
+            raise RuntimeError("Fila de envio de mensagens cheia")
+        return future
+
+    def _deliver(self, dados):
+        tentativa = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                message = self.client.messages.create(**dados)
+                logger.info(f"Mensagem enviada para {dados['to']}: {message.sid}")
+                return message
+            except Exception as e:
+                status = _status_code(e)
+                repetir = status is not None and (status == 429 or status >= 500)
+                if not repetir or tentativa >= self.max_retries:
+                    logger.error(f"Erro ao enviar mensagem para {dados['to']}: {e}")
+                    raise
+                espera = self.base_delay * (2 ** tentativa) * random.uniform(0.5, 1.5)
+                logger.warning(f"Twilio respondeu {status}, nova tentativa em {espera:.1f}s")
+                time.sleep(espera)
+                tentativa += 1
+
+    def queue_depths(self):
+        """Mensagens aguardando envio por destinatário"""
+        return self._executor.queue_depths()
+
+# Despachante único do número: app.py e WhatsAppHandler enviam por ele, então
+# o limite de envios por segundo vale para o processo inteiro
+dispatcher = OutboundDispatcher(
+    provider.twilio,
+    os.environ.get("TWILIO_NUMBER"),
+    rate=float(os.environ.get("TWILIO_MESSAGES_PER_SECOND", 1)),
+    burst=int(os.environ.get("TWILIO_MESSAGES_BURST", 5)),
+    workers=int(os.environ.get("OUTBOUND_WORKERS", 4))
+)
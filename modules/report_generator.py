@@ -70,7 +70,7 @@ class ReportGenerator:
                 filters["category"] = params["category"]
             
             # Obter dados da planilha
-            result = self.sheets_manager.get_expenses(filters)
+            result = self.sheets_manager.get_expense_totals(filters)
             
             if not result.get("success"):
                 return result
@@ -1,68 +1,61 @@
 # modules/speech_processor.py
-import os
-import requests
-import whisper
-import tempfile
-from pydub import AudioSegment
 import logging
+from modules.transcription_service import service as transcription_service
+from modules.model_tiers import policy
+from modules.audio_pipeline import fetch_audio, trim_silence, SAMPLE_RATE
+from modules.stt_engines import get_engine, load_pcm
 
 logger = logging.getLogger(__name__)
 
 class SpeechProcessor:
-    def __init__(self):
-        # Inicializar modelo Whisper (pode ser "tiny", "base", "small", "medium", "large")
-        model_size = os.environ.get("WHISPER_MODEL", "base")
-        try:
-            logger.info(f"Carregando modelo Whisper {model_size}...")
-            self.model = whisper.load_model(model_size)
-            logger.info("Modelo Whisper carregado com sucesso")
-        except Exception as e:
-            logger.error(f"Erro ao carregar modelo Whisper: {str(e)}")
-            self.model = None
+    def __init__(self, model_size=None, engine=None):
+        # Modelo fixo ("tiny", "base", "small", "medium", "large"); sem ele,
+        # a política de modelos escolhe pela duração do áudio e pela carga
+        self.model_size = model_size
+        # Mecanismo ("whisper", "faster-whisper"); sem ele, o do serviço (STT_ENGINE)
+        self.engine = engine or transcription_service.engine
+    
+    def _transcribe(self, audio):
+        model_size = self.model_size or policy.choose(len(audio) / SAMPLE_RATE)
+        if self.engine != transcription_service.engine:
+            # Outro mecanismo: roda neste processo
+            return get_engine(self.engine, model_size).transcribe(audio, language="pt")
+        return transcription_service.transcribe(audio, model_name=model_size, language="pt")
     
     def transcribe_audio(self, audio_url):
         """Transcreve áudio de URL para texto"""
-        if not self.model:
-            raise ValueError("Modelo de reconhecimento de fala não inicializado")
-        
-        temp_dir = tempfile.mkdtemp()
-        ogg_path = os.path.join(temp_dir, "audio.ogg")
-        wav_path = os.path.join(temp_dir, "audio.wav")
-        
         try:
-            # Baixar o arquivo de áudio
+            # Baixar e decodificar em memória (PCM 16 kHz, formato aceito pelo Whisper)
             logger.info(f"Baixando áudio de {audio_url}")
-            response = requests.get(audio_url)
-            
-            if response.status_code != 200:
-                raise Exception(f"Falha ao baixar áudio: status {response.status_code}")
-            
-            # Salvar o arquivo
-            with open(ogg_path, "wb") as f:
-                f.write(response.content)
-            
-            # Converter OGG para WAV (formato aceito pelo Whisper)
-            logger.info("Convertendo OGG para WAV")
-            AudioSegment.from_file(ogg_path).export(wav_path, format="wav")
-            
-            # Transcrever usando Whisper
-            logger.info("Transcrevendo áudio com Whisper")
-            result = self.model.transcribe(wav_path, language="pt")
-            transcribed_text = result["text"]
-            
-            logger.info(f"Transcrição concluída: {transcribed_text[:50]}...")
-            return transcribed_text
+            audio = fetch_audio(audio_url)
+            if audio is None:
+                raise Exception("Falha ao baixar ou decodificar o áudio")
+            return self.transcribe_pcm(audio)
             
         except Exception as e:
             logger.error(f"Erro durante a transcrição de áudio: {str(e)}")
             raise
-        finally:
-            # Limpar arquivos temporários
-            try:
-                if os.path.exists(ogg_path):
-                    os.remove(ogg_path)
-                if os.path.exists(wav_path):
-                    os.remove(wav_path)
-                os.rmdir(temp_dir)
-            except Exception as e:
-                logger.warning(f"Erro ao limpar arquivos temporários: {str(e)}")
+    
+    def transcribe_pcm(self, audio):
+        """Transcreve um array PCM (float32, 16 kHz) ou um arquivo de áudio local"""
+        # Remover silêncios para o modelo processar só a fala
+        audio = trim_silence(load_pcm(audio))
+        
+        logger.info(f"Transcrevendo áudio com {self.engine}")
+        transcribed_text = self._transcribe(audio)["text"]
+        
+        logger.info(f"Transcrição concluída: {transcribed_text[:50]}...")
+        return transcribed_text
+    
+    def transcribe_batch(self, audios):
+        """Transcreve vários arrays PCM ou arquivos locais, retornando os textos na mesma ordem"""
+        audios = [trim_silence(load_pcm(audio)) for audio in audios]
+        if not audios:
+            return []
+        # Um modelo para o lote todo, escolhido pelo áudio mais longo
+        model_size = self.model_size or policy.choose(max(len(audio) for audio in audios) / SAMPLE_RATE)
+        if self.engine != transcription_service.engine:
+            results = get_engine(self.engine, model_size).transcribe_batch(audios, language="pt")
+        else:
+            results = transcription_service.transcribe_batch(audios, model_name=model_size, language="pt")
+        return [result["text"] for result in results]
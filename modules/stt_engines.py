@@ -0,0 +1,138 @@
+# modules/stt_engines.py
+import os
+import threading
+import time
+import logging
+import numpy as np
+from modules.whisper_models import registry
+from modules.audio_pipeline import decode_audio, SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Uma janela do Whisper: 30 s a 16 kHz
+MAX_BATCH_SAMPLES = 30 * SAMPLE_RATE
+
+def load_pcm(audio):
+    """Aceita um caminho de arquivo ou um array PCM e retorna float32 mono a 16 kHz"""
+    if isinstance(audio, np.ndarray):
+        return audio.astype(np.float32, copy=False)
+    with open(audio, "rb") as f:
+        pcm = decode_audio(f.read())
+    if pcm is None:
+        raise ValueError(f"Não foi possível decodificar o áudio {audio}")
+    return pcm
+
+class SpeechToTextEngine:
+    """Interface dos mecanismos de transcrição.
+
+    transcribe() recebe um caminho ou um array PCM (float32, 16 kHz) e retorna
+    um dict com ao menos "text"; transcribe_batch() faz o mesmo para uma lista.
+    """
+
+    name = None
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def transcribe(self, audio, language="pt", **options):
+        raise NotImplementedError
+
+    def transcribe_batch(self, audios, language="pt", **options):
+        return [self.transcribe(audio, language=language, **options) for audio in audios]
+
+    def warmup(self):
+        """Carrega o modelo e faz uma inferência com 1 s de silêncio"""
+        inicio = time.perf_counter()
+        self.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))
+        logger.info(f"Mecanismo {self.name} ({self.model_name}) aquecido em {time.perf_counter() - inicio:.1f}s")
+
+class WhisperEngine(SpeechToTextEngine):
+    """Whisper da OpenAI (PyTorch), com os modelos do registro compartilhado"""
+
+    name = "whisper"
+
+    def transcribe(self, audio, language="pt", **options):
+        options.setdefault("fp16", False)
+        result = registry.transcribe(load_pcm(audio), self.model_name, language=language, **options)
+        return {"text": result["text"], "language": result.get("language", language)}
+
+    def transcribe_batch(self, audios, language="pt", **options):
+        # Áudios de até 30 s (uma janela do Whisper) vão num único lote; os
+        # mais longos precisam da janela deslizante do transcribe()
+        pcms = [load_pcm(audio) for audio in audios]
+        curtos = [i for i, pcm in enumerate(pcms) if len(pcm) <= MAX_BATCH_SAMPLES]
+        results = [None] * len(pcms)
+        if len(curtos) > 1:
+            lote = registry.decode_batch(
+                [pcms[i] for i in curtos], self.model_name, language=language, fp16=options.get("fp16", False)
+            )
+            for i, result in zip(curtos, lote):
+                results[i] = result
+        for i, pcm in enumerate(pcms):
+            if results[i] is None:
+                results[i] = self.transcribe(pcm, language=language, **options)
+        return results
+
+    def warmup(self):
+        registry.warmup(self.model_name)
+
+class FasterWhisperEngine(SpeechToTextEngine):
+    """faster-whisper (CTranslate2), otimizado para CPU com quantização int8.
+
+    Dependência opcional: pip install faster-whisper
+    """
+
+    name = "faster-whisper"
+
+    def __init__(self, model_name, compute_type=None, cpu_threads=None, beam_size=5):
+        super().__init__(model_name)
+        self.compute_type = compute_type or os.environ.get("FASTER_WHISPER_COMPUTE_TYPE", "int8")
+        self.cpu_threads = cpu_threads or int(os.environ.get("FASTER_WHISPER_THREADS", 0))
+        self.beam_size = beam_size
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                try:
+                    from faster_whisper import WhisperModel
+                except ImportError:
+                    raise ImportError("O mecanismo faster-whisper requer o pacote faster-whisper (pip install faster-whisper)")
+                logger.info(f"Carregando modelo faster-whisper {self.model_name} ({self.compute_type})...")
+                self._model = WhisperModel(
+                    self.model_name, device="cpu", compute_type=self.compute_type, cpu_threads=self.cpu_threads
+                )
+            return self._model
+
+    def transcribe(self, audio, language="pt", **options):
+        options.pop("fp16", None)
+        options.setdefault("beam_size", self.beam_size)
+        model = self._get_model()
+        segments, info = model.transcribe(load_pcm(audio), language=language, **options)
+        # Os segmentos são gerados sob demanda: a decodificação acontece aqui
+        text = "".join(segment.text for segment in segments)
+        return {"text": text, "language": info.language}
+
+ENGINES = {
+    WhisperEngine.name: WhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+}
+
+DEFAULT_ENGINE = os.environ.get("STT_ENGINE", WhisperEngine.name)
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_engine(name=None, model_name=None):
+    """Retorna o mecanismo `name` com o modelo `model_name`, criado uma vez por processo"""
+    name = name or DEFAULT_ENGINE
+    model_name = model_name or registry.default_model
+    if name not in ENGINES:
+        raise ValueError(f"Mecanismo de transcrição desconhecido: {name} (opções: {', '.join(ENGINES)})")
+    with _engines_lock:
+        engine = _engines.get((name, model_name))
+        if engine is None:
+            engine = ENGINES[name](model_name)
+            _engines[(name, model_name)] = engine
+        return engine
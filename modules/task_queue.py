@@ -0,0 +1,195 @@
+# modules/task_queue.py
+import atexit
+import os
+import queue
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class WorkerPool:
+    """Pool de threads com fila limitada para processar tarefas fora da requisição HTTP.
+
+    submit() espera no máximo submit_timeout segundos por uma vaga na fila; se
+    ela continuar cheia, retorna None para que o chamador aplique backpressure
+    (ex.: responder 503 e deixar o Twilio tentar de novo). No desligamento, as
+    tarefas já enfileiradas são concluídas antes de sair.
+    """
+
+    def __init__(self, num_workers=4, max_queue=100, submit_timeout=0.5, name="worker"):
+        self.num_workers = num_workers
+        self.max_queue = max_queue
+        self.submit_timeout = submit_timeout
+        self.name = name
+        self._lock = threading.Lock()
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._closed = False
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        # Threads são criadas no primeiro uso e recriadas após um fork
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Pool '{self.name}' iniciado com {self.num_workers} threads (fila máx. {self.max_queue})")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                logger.error(f"Erro em tarefa do pool '{self.name}': {e}")
+                future.set_exception(e)
+
+    def submit(self, fn, *args, **kwargs):
+        """Enfileira fn(*args, **kwargs) e retorna um Future, ou None se a fila estiver cheia"""
+        with self._lock:
+            if self._closed:
+                return None
+            self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put((future, fn, args, kwargs), timeout=self.submit_timeout)
+        except queue.Full:
+            logger.warning(f"Fila do pool '{self.name}' cheia ({self.max_queue} tarefas), recusando")
+            return None
+        return future
+
+    def pending(self):
+        """Número de tarefas aguardando na fila"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def shutdown(self, wait=True, timeout=30):
+        """Para de aceitar tarefas e, se wait=True, espera a fila esvaziar"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._pid != os.getpid():
+                return
+        logger.info(f"Encerrando pool '{self.name}' ({self.pending()} tarefas pendentes)")
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join(timeout=timeout)
+
+class KeyedExecutor:
+    """Executa tarefas em ordem (FIFO) por chave, com chaves diferentes em paralelo.
+
+    Cada chave (ex.: número do remetente) tem sua própria fila lógica; no máximo
+    uma tarefa por chave roda por vez, sobre as threads compartilhadas de um
+    WorkerPool. max_pending limita o total de tarefas aguardando (backpressure).
+    """
+
+    def __init__(self, pool, max_pending=100):
+        self.pool = pool
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._active = set()
+        self._running = set()
+        self._pending = 0
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Enfileira fn(*args, **kwargs) na fila da chave; retorna um Future, ou None se estiver cheio"""
+        future = Future()
+        item = (future, fn, args, kwargs)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                logger.warning(f"Limite de {self.max_pending} tarefas pendentes atingido, recusando ({key})")
+                return None
+            self._queues.setdefault(key, deque()).append(item)
+            self._pending += 1
+            start = key not in self._active
+            if start:
+                self._active.add(key)
+            depth = len(self._queues[key])
+
+        if depth > 1:
+            logger.info(f"Fila de {key}: {depth} tarefas aguardando")
+        if start and self.pool.submit(self._drain, key) is None:
+            with self._lock:
+                fila = self._queues[key]
+                fila.remove(item)
+                self._pending -= 1
+                if not fila:
+                    del self._queues[key]
+                    self._active.discard(key)
+                    return None
+            # Enquanto o pool.submit esperava (sem o lock), outras tarefas da mesma
+            # chave entraram na fila e já receberam um Future: elas ainda precisam
+            # de quem as drene
+            self._reschedule(key)
+            return None
+        return future
+
+    def _reschedule(self, key):
+        if self.pool.submit(self._drain, key) is None:
+            logger.warning(f"Pool cheio, drenando a fila de {key} em uma thread dedicada")
+            threading.Thread(target=self._drain, args=(key,), name=f"drain-{key}", daemon=True).start()
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                fila = self._queues.get(key)
+                if not fila:
+                    self._queues.pop(key, None)
+                    self._active.discard(key)
+                    return
+                future, fn, args, kwargs = fila.popleft()
+                self._pending -= 1
+                self._running.add(key)
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except Exception as e:
+                        logger.error(f"Erro em tarefa da chave {key}: {e}")
+                        future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running.discard(key)
+
+            # Devolve a thread ao pool para alternar com outras chaves; se o pool
+            # estiver cheio, continua drenando nesta mesma thread
+            with self._lock:
+                has_more = bool(self._queues.get(key))
+                if not has_more:
+                    self._queues.pop(key, None)
+                    self._active.discard(key)
+                    return
+            if self.pool.submit(self._drain, key) is not None:
+                return
+
+    def queue_depths(self):
+        """Métrica: tarefas por chave, contando as que aguardam e a que está em execução"""
+        with self._lock:
+            return {
+                key: len(self._queues.get(key, ())) + (1 if key in self._running else 0)
+                for key in self._active
+            }
+
+    def pending(self):
+        """Total de tarefas aguardando em todas as chaves"""
+        with self._lock:
+            return self._pending
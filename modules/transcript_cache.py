@@ -0,0 +1,111 @@
+# modules/transcript_cache.py
+import hashlib
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def content_key(data):
+    """Chave do cache: SHA-256 dos bytes do áudio baixado"""
+    return hashlib.sha256(data).hexdigest()
+
+class TranscriptCache:
+    """Cache de transcrições endereçado pelo conteúdo do áudio.
+
+    Áudios encaminhados ou reenviados têm os mesmos bytes, então a transcrição
+    é reaproveitada sem passar pelo Whisper. Mantém um LRU em memória com até
+    max_entries itens e, se disk_path for informado, um SQLite local limitado a
+    max_disk_bytes (remove os menos usados recentemente quando passa do limite).
+    """
+
+    def __init__(self, max_entries=1000, disk_path=None, max_disk_bytes=20 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS transcripts "
+                    "(key TEXT PRIMARY KEY, text TEXT, size INTEGER, accessed REAL)"
+                )
+            except Exception as e:
+                logger.error(f"Erro ao abrir cache de transcrições em {disk_path}: {e}")
+                self._db = None
+
+    def _remember(self, key, text):
+        self._entries[key] = text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Retorna a transcrição guardada para a chave, ou None"""
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT text FROM transcripts WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        self._db.execute("UPDATE transcripts SET accessed = ? WHERE key = ?", (time.time(), key))
+                        self._remember(key, row[0])
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return row[0]
+                except Exception as e:
+                    logger.error(f"Erro ao ler cache de transcrições: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, key, text):
+        """Guarda a transcrição e aplica o limite de tamanho do disco"""
+        with self._lock:
+            self._remember(key, text)
+            if self._db is None:
+                return
+            try:
+                size = len(key) + len(text.encode("utf-8"))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO transcripts (key, text, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, text, size, time.time())
+                )
+                self._evict_disk()
+            except Exception as e:
+                logger.error(f"Erro ao gravar cache de transcrições: {e}")
+
+    def _evict_disk(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM transcripts").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        removidos = 0
+        for key, size in self._db.execute("SELECT key, size FROM transcripts ORDER BY accessed").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM transcripts WHERE key = ?", (key,))
+            total -= size
+            removidos += 1
+        logger.info(f"Cache de transcrições em disco: {removidos} entradas removidas ({total} bytes)")
+
+    def stats(self):
+        """Contadores de acertos e falhas"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "entries": len(self._entries)
+            }
@@ -0,0 +1,468 @@
+# modules/transcription_service.py
+import atexit
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import logging
+from concurrent.futures import CancelledError, Future, InvalidStateError, ProcessPoolExecutor, TimeoutError
+from concurrent.futures import wait as wait_all
+from concurrent.futures.process import BrokenProcessPool
+from modules.task_queue import WorkerPool
+from modules.whisper_models import registry
+from modules.stt_engines import get_engine, DEFAULT_ENGINE
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+def _init_worker(engine_name, model_names, threads, warmup, pids=None):
+    # Roda uma vez em cada processo do pool: cada um mantém os seus modelos carregados
+    # e informa o seu PID, para o pool poder ser encerrado se uma transcrição travar
+    if pids is not None:
+        pids.put(os.getpid())
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    registry.default_model = model_names[0]
+    if warmup:
+        for model_name in model_names:
+            try:
+                get_engine(engine_name, model_name).warmup()
+            except Exception as e:
+                logger.error(f"Erro ao aquecer {engine_name} ({model_name}): {e}")
+
+def _transcribe(audio, engine_name, model_name, options):
+    return get_engine(engine_name, model_name).transcribe(audio, **options)
+
+def _transcribe_batch(audios, engine_name, model_name, options):
+    return get_engine(engine_name, model_name).transcribe_batch(audios, **options)
+
+def _duration(audio, sample_rate=16000):
+    # Duração em segundos quando o áudio é um array PCM (caminhos de arquivo: None)
+    return len(audio) / sample_rate if hasattr(audio, "__len__") and not isinstance(audio, str) else None
+
+def _settle(future, result=None, error=None):
+    # Responde o pedido, a menos que outro caminho (timeout, cópia reenviada) já tenha respondido
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+def _ping():
+    return os.getpid()
+
+def _default_start_method():
+    # fork copiaria as threads já criadas pelo app (buffer de gravação, agendador)
+    # no estado em que estiverem, inclusive locks travados
+    metodos = multiprocessing.get_all_start_methods()
+    return "forkserver" if "forkserver" in metodos else "spawn"
+
+class TranscriptionService:
+    """Transcrição com Whisper fora das threads do Flask.
+
+    Com num_workers > 0, usa um pool de processos próprio (cada processo com um
+    modelo carregado), para a inferência não disputar o GIL com as requisições.
+    Com num_workers = 0, transcreve no próprio processo em uma thread, usando o
+    registro de modelos compartilhado.
+
+    A fila é limitada a max_pending tarefas: submit() retorna None quando ela
+    está cheia. Se uma transcrição já em execução passa do timeout, o pool de
+    processos é trocado por um novo: as demais tarefas ainda não concluídas no
+    pool antigo são reenviadas ao novo (se uma já rodava lá, responde a cópia
+    que terminar primeiro) e só os pedidos da tarefa travada falham com
+    TimeoutError. Quando os pedidos reenviados têm resposta (ou passado mais um
+    timeout), os processos do pool antigo são encerrados pelos PIDs que cada um
+    informou ao iniciar; encerrá-los antes quebraria as tarefas que ainda rodam
+    lá. Os processos são criados com forkserver (ou spawn), nunca com fork de
+    um processo que já tem threads.
+
+    Cada processo aquece o modelo padrão e os registrados com warm() (ex.: os
+    níveis de modules.model_tiers) ao iniciar; outros modelos pedidos em
+    submit() são carregados sob demanda. pending() e real_time_factor()
+    alimentam a escolha de modelo.
+
+    Micro-lotes: quando todos os workers estão ocupados, áudios PCM que chegam
+    em até batch_window segundos (no máximo max_batch) são agrupados por modelo
+    e transcritos juntos com transcribe_batch() do mecanismo. Com os workers
+    livres, cada áudio segue na hora, sem espera.
+    """
+
+    def __init__(self, num_workers=2, max_pending=8, timeout=120, model_name=None, engine=None,
+                 threads_per_worker=None, start_method=None, submit_timeout=0.5,
+                 batch_window=0.2, max_batch=8):
+        self.num_workers = num_workers
+        self.engine = engine or DEFAULT_ENGINE
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.model_name = model_name or registry.default_model
+        self.warm_models = [self.model_name]
+        self.threads_per_worker = threads_per_worker
+        self.start_method = start_method or _default_start_method()
+        self.submit_timeout = submit_timeout
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._threads = None
+        self._pid = None
+        self._ready = threading.Event()
+        self._pending = 0
+        self._in_flight = 0
+        self._batch_queue = None
+        self._rtf = {}
+        # Tarefas despachadas ao pool de processos: (pool, fn, args, pedidos atendidos)
+        self._tasks = {}
+        # Tarefa que atende cada pedido, e tarefas do pool antigo já reenviadas a outro pool
+        self._task_of = {}
+        self._moved = set()
+        # PIDs informados pelos processos de cada pool
+        self._pids = {}
+        atexit.register(self.shutdown)
+
+    def _create_executor(self, warmup=True):
+        context = multiprocessing.get_context(self.start_method)
+        pids = context.Queue()
+        executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.engine, list(self.warm_models), self.threads_per_worker, warmup, pids)
+        )
+        self._pids[executor] = pids
+        logger.info(
+            f"Pool de transcrição iniciado com {self.num_workers} processos "
+            f"({self.engine}, modelos {', '.join(self.warm_models)})"
+        )
+        return executor
+
+    def _ensure_started(self, warmup=True):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._ready.clear()
+            if self.num_workers > 0:
+                self._executor = self._create_executor(warmup)
+            else:
+                self._threads = WorkerPool(num_workers=1, max_queue=self.max_pending, name="transcricao")
+            if self.max_batch > 1:
+                self._batch_queue = queue.Queue()
+                threading.Thread(
+                    target=self._run_batcher, args=(self._batch_queue,), name="transcricao-lotes", daemon=True
+                ).start()
+
+    def warm(self, model_names):
+        """Registra modelos para aquecer em cada worker ao iniciar (chamar antes de start())"""
+        for name in model_names:
+            if name not in self.warm_models:
+                self.warm_models.append(name)
+
+    def start(self, warmup=True, wait=False):
+        """Inicia os workers e aquece os modelos em cada um; com wait=True aguarda o primeiro ficar pronto"""
+        self._ensure_started(warmup)
+        if self._executor is not None:
+            future = self._executor.submit(_ping)
+        else:
+            future = self._threads.submit(_init_worker, self.engine, list(self.warm_models), None, warmup)
+        if future is None:
+            return
+        future.add_done_callback(self._mark_ready)
+        if wait:
+            try:
+                future.result(timeout=self.timeout)
+            except Exception as e:
+                logger.error(f"Erro ao iniciar o pool de transcrição: {e}")
+
+    def _mark_ready(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self._ready.set()
+
+    def is_ready(self):
+        """True quando ao menos um worker já tem os modelos carregados"""
+        return self._ready.is_set()
+
+    def _dispatch(self, fn, *args, owners=()):
+        """Envia fn(*args) aos workers; recria o pool de processos se ele quebrou.
+
+        `owners` são os Futures dos pedidos atendidos por esta tarefa: recebem
+        o resultado (ou o erro) dela, e um timeout em um deles sabe qual tarefa
+        e qual pool reciclar.
+        """
+        executor = self._executor
+        if executor is None:
+            future = self._threads.submit(fn, *args)
+        else:
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                # Um worker morreu (ex.: falta de memória): recria o pool e tenta de novo
+                logger.error("Pool de transcrição quebrado, recriando")
+                with self._lock:
+                    if self._executor is executor:
+                        self._pids.pop(executor, None)
+                        self._executor = self._create_executor()
+                    executor = self._executor
+                future = executor.submit(fn, *args)
+        if future is not None:
+            with self._lock:
+                self._in_flight += 1
+                if executor is not None:
+                    self._tasks[future] = (executor, fn, args, list(owners))
+                    for owner in owners:
+                        self._task_of[owner] = future
+            future.add_done_callback(self._dispatch_done)
+            future.add_done_callback(lambda f, owners=list(owners): self._distribute(f, owners))
+        return future
+
+    def _dispatch_done(self, future):
+        with self._lock:
+            self._in_flight -= 1
+            self._tasks.pop(future, None)
+
+    def _recycle(self, executor, hung):
+        """Troca o pool de processos por um novo, reenviando a ele as tarefas não concluídas do antigo além de `hung`"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = self._create_executor()
+            waiting = [(task, spec) for task, spec in self._tasks.items() if spec[0] is executor and task is not hung]
+            owners = self._tasks.get(hung, (None, None, None, []))[3]
+        logger.error("Transcrição travada: recriando o pool de transcrição")
+        # O executor marca como "em execução" também as tarefas já entregues à fila
+        # interna dele, que talvez nunca rodem: todas as não concluídas são
+        # reenviadas, e responde a cópia que terminar primeiro
+        moved = []
+        for task, (_, fn, args, task_owners) in waiting:
+            with self._lock:
+                self._moved.add(task)
+            task.cancel()
+            # Pedidos que já falharam por timeout não precisam de uma cópia
+            if not all(owner.done() for owner in task_owners):
+                self._dispatch(fn, *args, owners=task_owners)
+                moved.extend(task_owners)
+        erro = TimeoutError("Transcrição travada")
+        for owner in owners:
+            _settle(owner, error=erro)
+        threading.Thread(
+            target=self._retire, args=(executor, moved), name="transcricao-reciclagem", daemon=True
+        ).start()
+
+    def _retire(self, executor, owners):
+        """Encerra o pool antigo quando os pedidos reenviados tiverem resposta (ou depois de mais um timeout)"""
+        wait_all(owners, timeout=self.timeout)
+        pids = self._pids.pop(executor, None)
+        while pids is not None:
+            try:
+                pid = pids.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _expire(self, futures, timeout):
+        """Faz os pedidos que passaram do prazo falharem com TimeoutError e recicla
+        o pool se a tarefa de algum deles já estava rodando em um worker"""
+        logger.error(f"Transcrição excedeu {timeout:.0f}s")
+        travadas = []
+        for future in futures:
+            if future.cancel():
+                continue
+            with self._lock:
+                task = self._task_of.get(future)
+                spec = self._tasks.get(task)
+            _settle(future, error=TimeoutError(f"Transcrição excedeu {timeout:.0f}s"))
+            # Na fila do pool, a tarefa só espera a vez; em execução, está travada
+            if spec is not None and task.running():
+                travadas.append((spec[0], task))
+        # Todos os pedidos vencidos já falharam antes: _recycle() não reenvia as tarefas deles
+        for executor, task in travadas:
+            self._recycle(executor, task)
+
+    def _wait(self, future, timeout):
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            self._expire([future], timeout)
+            raise
+
+    def submit(self, audio, model_name=None, **options):
+        """Enfileira a transcrição de `audio`; retorna um Future com o resultado do Whisper, ou None se a fila estiver cheia"""
+        self._ensure_started()
+        model_name = model_name or self.model_name
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            logger.warning(f"Fila de transcrição cheia ({self.max_pending} tarefas), recusando")
+            return None
+        duracao = _duration(audio)
+        if self._batch_queue is not None and duracao is not None:
+            # Áudio PCM: passa pelo agrupador de lotes
+            future = Future()
+            self._batch_queue.put((future, audio, model_name, options))
+        else:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            try:
+                tarefa = self._dispatch(_transcribe, audio, self.engine, model_name, options, owners=[future])
+            except Exception:
+                self._slots.release()
+                raise
+            if tarefa is None:
+                self._slots.release()
+                return None
+        with self._lock:
+            self._pending += 1
+        inicio = time.monotonic()
+        future.add_done_callback(lambda f: self._job_done(f, model_name, inicio, duracao))
+        return future
+
+    def _busy(self):
+        with self._lock:
+            return self._in_flight >= max(1, self.num_workers)
+
+    def _run_batcher(self, fila):
+        while True:
+            item = fila.get()
+            if item is _STOP:
+                return
+            lote = [item]
+            # Só espera por mais áudios se os workers estão todos ocupados
+            limite = time.monotonic() + (self.batch_window if self._busy() else 0)
+            parar = False
+            while len(lote) < self.max_batch:
+                restante = limite - time.monotonic()
+                try:
+                    item = fila.get(timeout=restante) if restante > 0 else fila.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    parar = True
+                    break
+                lote.append(item)
+            self._run_batch(lote)
+            if parar:
+                return
+
+    def _run_batch(self, lote):
+        # Áudios cujo pedido já expirou (timeout) são descartados aqui
+        grupos = {}
+        for future, audio, model_name, options in lote:
+            if future.set_running_or_notify_cancel():
+                chave = (model_name, tuple(sorted(options.items())))
+                grupos.setdefault(chave, []).append((future, audio))
+
+        for (model_name, opcoes), itens in grupos.items():
+            futures = [future for future, _ in itens]
+            options = dict(opcoes)
+            try:
+                if len(itens) == 1:
+                    tarefa = self._dispatch(_transcribe, itens[0][1], self.engine, model_name, options, owners=futures)
+                else:
+                    logger.info(f"Transcrevendo lote de {len(itens)} áudios ({model_name})")
+                    tarefa = self._dispatch(
+                        _transcribe_batch, [audio for _, audio in itens], self.engine, model_name, options,
+                        owners=futures
+                    )
+                if tarefa is None:
+                    raise RuntimeError("Fila de transcrição cheia")
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+
+    def _distribute(self, tarefa, futures):
+        # Entrega a cada pedido o seu resultado (ou o erro do lote inteiro); pedidos
+        # que já falharam por timeout são pulados
+        with self._lock:
+            movida = tarefa in self._moved
+            self._moved.discard(tarefa)
+        erro = CancelledError() if tarefa.cancelled() else tarefa.exception()
+        if erro is not None and movida:
+            # Reenviada a outro pool por _recycle(): a cópia nova entrega o resultado
+            return
+        if erro is not None:
+            for future in futures:
+                _settle(future, error=erro)
+            return
+        resultados = tarefa.result() if len(futures) > 1 else [tarefa.result()]
+        for future, resultado in zip(futures, resultados):
+            _settle(future, resultado)
+
+    def _job_done(self, future, model_name, inicio, duracao):
+        self._slots.release()
+        with self._lock:
+            self._pending -= 1
+            self._task_of.pop(future, None)
+            if duracao and not future.cancelled() and future.exception() is None:
+                # Média móvel do fator de tempo real (tempo de espera + inferência / duração)
+                rtf = (time.monotonic() - inicio) / duracao
+                anterior = self._rtf.get(model_name)
+                self._rtf[model_name] = rtf if anterior is None else 0.8 * anterior + 0.2 * rtf
+
+    def pending(self):
+        """Transcrições enfileiradas ou em execução"""
+        with self._lock:
+            return self._pending
+
+    def real_time_factor(self, model_name=None):
+        """Segundos de processamento por segundo de áudio observados para o modelo, ou None"""
+        with self._lock:
+            return self._rtf.get(model_name or self.model_name)
+
+    def transcribe(self, audio, timeout=None, model_name=None, **options):
+        """Transcreve e aguarda o resultado por até `timeout` segundos"""
+        future = self.submit(audio, model_name, **options)
+        if future is None:
+            raise RuntimeError("Fila de transcrição cheia")
+        return self._wait(future, timeout or self.timeout)
+
+    def transcribe_batch(self, audios, timeout=None, model_name=None, **options):
+        """Transcreve vários áudios em paralelo nos workers e retorna os resultados na mesma ordem"""
+        futures = [self.submit(audio, model_name, **options) for audio in audios]
+        if any(future is None for future in futures):
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+            raise RuntimeError("Fila de transcrição cheia")
+        # Um prazo único para o lote inteiro, não `timeout` por áudio
+        timeout = timeout or self.timeout
+        _, atrasados = wait_all(futures, timeout=timeout)
+        if atrasados:
+            self._expire(atrasados, timeout)
+            raise TimeoutError(f"{len(atrasados)} de {len(futures)} transcrições excederam {timeout:.0f}s")
+        return [future.result() for future in futures]
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            if self._batch_queue is not None:
+                self._batch_queue.put(_STOP)
+                self._batch_queue = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._pids.pop(self._executor, None)
+                self._executor = None
+            if self._threads is not None:
+                self._threads.shutdown(wait=wait)
+                self._threads = None
+            self._pid = None
+
+# Serviço compartilhado por app.py e SpeechProcessor
+service = TranscriptionService(
+    num_workers=int(os.environ.get("TRANSCRIPTION_WORKERS", 2)),
+    max_pending=int(os.environ.get("TRANSCRIPTION_QUEUE_SIZE", 8)),
+    timeout=float(os.environ.get("TRANSCRIPTION_TIMEOUT_SECONDS", 120)),
+    engine=os.environ.get("STT_ENGINE") or None,
+    threads_per_worker=int(os.environ.get("TRANSCRIPTION_THREADS_PER_WORKER", 0)) or None,
+    start_method=os.environ.get("TRANSCRIPTION_START_METHOD") or None,
+    batch_window=float(os.environ.get("TRANSCRIPTION_BATCH_WINDOW_MS", 200)) / 1000,
+    max_batch=int(os.environ.get("TRANSCRIPTION_MAX_BATCH", 8))
+)
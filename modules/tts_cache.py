@@ -0,0 +1,265 @@
+# modules/tts_cache.py
+import hashlib
+import os
+import threading
+import uuid
+import logging
+from collections import OrderedDict
+from modules.tts_engines import create_engine
+
+logger = logging.getLogger(__name__)
+
+UNITS = [
+    "zero", "um", "dois", "três", "quatro", "cinco", "seis", "sete", "oito", "nove", "dez",
+    "onze", "doze", "treze", "quatorze", "quinze", "dezesseis", "dezessete", "dezoito", "dezenove"
+]
+TENS = ["", "", "vinte", "trinta", "quarenta", "cinquenta", "sessenta", "setenta", "oitenta", "noventa"]
+HUNDREDS = [
+    "", "cento", "duzentos", "trezentos", "quatrocentos", "quinhentos",
+    "seiscentos", "setecentos", "oitocentos", "novecentos"
+]
+SCALES = [(10 ** 9, "bilhão", "bilhões"), (10 ** 6, "milhão", "milhões"), (1000, "mil", "mil")]
+
+def _group_words(n):
+    # 1 a 999 por extenso
+    if n == 100:
+        return "cem"
+    parts = []
+    if n >= 100:
+        parts.append(HUNDREDS[n // 100])
+        n %= 100
+    if n >= 20:
+        parts.append(TENS[n // 10] + (f" e {UNITS[n % 10]}" if n % 10 else ""))
+    elif n:
+        parts.append(UNITS[n])
+    return " e ".join(parts)
+
+def number_fragments(n):
+    """Número inteiro por extenso em português, em fragmentos reaproveitáveis.
+
+    Ex.: 1500 -> ["mil", "e", "quinhentos"]; 2.340.001 -> ["dois", "milhões",
+    "trezentos e quarenta", "mil", "e", "um"].
+    """
+    if n == 0:
+        return [UNITS[0]]
+    fragments = []
+    for value, singular, plural in SCALES:
+        count, n = divmod(n, value)
+        if count:
+            if not (value == 1000 and count == 1):
+                fragments.extend(number_fragments(count))
+            fragments.append(singular if count == 1 else plural)
+    if n:
+        # "e" antes do último grupo quando ele é menor que 100 ou centena exata
+        if fragments and (n < 100 or n % 100 == 0):
+            fragments.append("e")
+        fragments.append(_group_words(n))
+    return fragments
+
+def number_to_words(n):
+    return " ".join(number_fragments(n))
+
+def amount_fragments(cents):
+    """Valor em centavos por extenso: 2550 -> ["vinte e cinco", "reais", "e", "cinquenta", "centavos"]"""
+    reais, centavos = divmod(abs(int(cents)), 100)
+    fragments = []
+    if reais:
+        fragments.extend(number_fragments(reais))
+        if reais % 10 ** 6 == 0:
+            fragments.append("de")
+        fragments.append("real" if reais == 1 else "reais")
+    if centavos:
+        if reais:
+            fragments.append("e")
+        fragments.extend(number_fragments(centavos))
+        fragments.append("centavo" if centavos == 1 else "centavos")
+    return fragments or ["zero", "reais"]
+
+class TTSCache:
+    """Arquivos de áudio sintetizados, endereçados pelo hash de (idioma, formato, texto).
+
+    Os arquivos ficam em cache_dir (dentro de static/, para serem servidos como
+    mídia) e são removidos do menos usado recentemente para o mais usado quando
+    o total passa de max_bytes. Nada é lido ou criado no disco até o primeiro
+    uso: o índice é carregado na primeira consulta e o diretório, criado na
+    primeira gravação.
+    """
+
+    def __init__(self, cache_dir, max_bytes=100 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total = 0
+        self.hits = 0
+        self.misses = 0
+        self._loaded = False
+
+    def _load_locked(self):
+        # Reconstrói o índice LRU a partir dos arquivos existentes (mais antigos primeiro)
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.isdir(self.cache_dir):
+            return
+        arquivos = []
+        for nome in os.listdir(self.cache_dir):
+            caminho = os.path.join(self.cache_dir, nome)
+            if os.path.isfile(caminho) and not nome.startswith("."):
+                arquivos.append((os.path.getmtime(caminho), nome, os.path.getsize(caminho)))
+        for _, nome, tamanho in sorted(arquivos):
+            self._entries[nome] = tamanho
+            self._total += tamanho
+
+    @staticmethod
+    def key(text, lang="pt", fmt="mp3"):
+        return hashlib.sha256(f"{lang}|{fmt}|{text}".encode("utf-8")).hexdigest() + f".{fmt}"
+
+    def get(self, text, lang="pt", fmt="mp3"):
+        """Caminho do áudio já sintetizado, ou None"""
+        nome = self.key(text, lang, fmt)
+        caminho = os.path.join(self.cache_dir, nome)
+        with self._lock:
+            self._load_locked()
+            if nome in self._entries and os.path.exists(caminho):
+                self._entries.move_to_end(nome)
+                self.hits += 1
+                try:
+                    os.utime(caminho)
+                except OSError:
+                    pass
+                return caminho
+            self._entries.pop(nome, None)
+            self.misses += 1
+            return None
+
+    def put(self, text, render, lang="pt", fmt="mp3"):
+        """Gera o áudio com render(caminho_temporario) e o guarda no cache; retorna o caminho final.
+
+        Se render() retornar False (áudio provisório, ex.: do mecanismo de
+        reserva), o arquivo ganha um nome avulso: é servido e entra na conta do
+        LRU, mas get() não o encontra e a próxima síntese tenta de novo.
+        """
+        nome = self.key(text, lang, fmt)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temporario = os.path.join(self.cache_dir, f".{uuid.uuid4().hex}.{fmt}")
+        try:
+            if render(temporario) is False:
+                nome = f"{uuid.uuid4().hex}.{fmt}"
+            caminho = os.path.join(self.cache_dir, nome)
+            os.replace(temporario, caminho)
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+        tamanho = os.path.getsize(caminho)
+        with self._lock:
+            self._load_locked()
+            self._total += tamanho - self._entries.pop(nome, 0)
+            self._entries[nome] = tamanho
+            self._evict(protegido=nome)
+        return caminho
+
+    def _evict(self, protegido):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            nome, tamanho = next(iter(self._entries.items()))
+            if nome == protegido:
+                break
+            del self._entries[nome]
+            self._total -= tamanho
+            try:
+                os.remove(os.path.join(self.cache_dir, nome))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            self._load_locked()
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._total}
+
+class PhraseSynthesizer:
+    """Síntese de voz com cache e montagem de frases a partir de fragmentos.
+
+    speak() sintetiza (ou reaproveita) o texto inteiro. speak_fragments() junta
+    fragmentos já sintetizados ("Despesa registrada", nomes de categoria, números
+    por extenso) com pydub, então uma confirmação repetida ou com outro valor
+    não precisa de nova chamada ao serviço de TTS.
+
+    `engine` é um TextToSpeechEngine (modules/tts_engines.py). Áudios que vieram
+    do mecanismo de reserva não ficam no cache com a chave do texto, para que a
+    voz do mecanismo principal os substitua depois.
+    """
+
+    def __init__(self, cache, engine=None, lang="pt", gap_ms=120):
+        self.cache = cache
+        self.engine = engine or create_engine()
+        self.lang = lang
+        self.gap_ms = gap_ms
+
+    def _synthesize(self, text, fmt):
+        # Retorna (caminho, definitivo); definitivo=False se o áudio veio do fallback
+        caminho = self.cache.get(text, self.lang, fmt)
+        if caminho:
+            return caminho, True
+        if fmt == "mp3":
+            definitivo = []
+
+            def render(destino):
+                definitivo.append(self.engine.render(text, self.lang, destino) is not False)
+                return definitivo[0]
+
+            return self.cache.put(text, render, self.lang, fmt), definitivo[0]
+        # Outros formatos são convertidos a partir do MP3 (também em cache)
+        origem, definitivo = self._synthesize(text, "mp3")
+
+        def converter(destino):
+            _convert(origem, destino, fmt)
+            return definitivo
+
+        return self.cache.put(text, converter, self.lang, fmt), definitivo
+
+    def speak(self, text, fmt="mp3"):
+        """Caminho de um áudio com o texto falado, sintetizando só se não estiver no cache"""
+        return self._synthesize(text, fmt)[0]
+
+    def speak_fragments(self, fragments, fmt="mp3"):
+        """Áudio com os fragmentos falados em sequência, montado a partir do cache de fragmentos"""
+        fragments = [f.strip() for f in fragments if f and f.strip()]
+        chave = "\x1f".join(fragments)
+        caminho = self.cache.get(chave, self.lang, fmt)
+        if caminho:
+            return caminho
+        partes = [self._synthesize(fragmento, "mp3") for fragmento in fragments]
+        definitivo = all(ok for _, ok in partes)
+        caminhos = [parte for parte, _ in partes]
+
+        def render(destino):
+            _concatenate(caminhos, destino, fmt, self.gap_ms)
+            return definitivo
+
+        return self.cache.put(chave, render, self.lang, fmt)
+
+    def expense_confirmation(self, categoria, valor_cents, fmt="mp3"):
+        """Confirmação falada de uma despesa: 'Despesa registrada. Categoria ... Valor ...'"""
+        fragments = ["Despesa registrada.", "Categoria", categoria.lower(), "Valor"] + amount_fragments(valor_cents)
+        return self.speak_fragments(fragments, fmt)
+
+def _convert(origem, destino, fmt):
+    from pydub import AudioSegment
+    AudioSegment.from_file(origem).export(destino, format=fmt)
+
+def _concatenate(partes, destino, fmt, gap_ms):
+    from pydub import AudioSegment
+    pausa = AudioSegment.silent(duration=gap_ms)
+    audio = AudioSegment.empty()
+    for i, parte in enumerate(partes):
+        if i:
+            audio += pausa
+        audio += AudioSegment.from_file(parte)
+    audio.export(destino, format=fmt)
+
+# Cache e sintetizador compartilhados por app.py e WhatsAppHandler
+cache = TTSCache(
+    os.environ.get("TTS_CACHE_DIR", os.path.join("static", "tts")),
+    max_bytes=int(os.environ.get("TTS_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+)
+synthesizer = PhraseSynthesizer(cache, create_engine())
@@ -0,0 +1,169 @@
+# modules/tts_engines.py
+import os
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+class TextToSpeechEngine:
+    """Interface dos mecanismos de síntese de voz.
+
+    render() grava o áudio do texto em `path` (MP3, ou WAV se o caminho terminar
+    em .wav) e retorna True se o áudio veio do mecanismo preferido (False quando
+    um mecanismo de reserva respondeu no lugar dele).
+    """
+
+    name = None
+
+    def render(self, text, lang, path):
+        raise NotImplementedError
+
+class GTTSEngine(TextToSpeechEngine):
+    """Google Text-to-Speech (requisição HTTPS a cada síntese, limitada a `timeout` segundos)"""
+
+    name = "gtts"
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+    def render(self, text, lang, path):
+        from gtts import gTTS
+        gTTS(text=text, lang=lang, timeout=self.timeout).save(path)
+        return True
+
+class CommandLineEngine(TextToSpeechEngine):
+    """Síntese local com um binário que lê o texto do stdin e grava um WAV.
+
+    `command` é uma linha de comando com {output} (arquivo WAV) e {voice};
+    o padrão é o espeak-ng. Para o piper, por exemplo:
+    "piper --model pt_BR-faber-medium.onnx --output_file {output}".
+    """
+
+    name = "local"
+
+    def __init__(self, command=None, voice=None, timeout=30):
+        self.command = command or "espeak-ng -v {voice} --stdin -w {output}"
+        self.voice = voice or "pt-br"
+        self.timeout = timeout
+
+    def render(self, text, lang, path):
+        wav_path = path if path.endswith(".wav") else f"{path}.{uuid.uuid4().hex}.wav"
+        args = [arg.format(output=wav_path, voice=self.voice) for arg in shlex.split(self.command)]
+        try:
+            result = subprocess.run(args, input=text.encode("utf-8"), capture_output=True, timeout=self.timeout)
+            if result.returncode != 0:
+                raise RuntimeError(f"{args[0]} falhou: {result.stderr.decode(errors='replace').strip()}")
+            if wav_path != path:
+                from pydub import AudioSegment
+                AudioSegment.from_wav(wav_path).export(path, format=os.path.splitext(path)[1].lstrip(".") or "mp3")
+        finally:
+            if wav_path != path and os.path.exists(wav_path):
+                os.remove(wav_path)
+        return True
+
+class FallbackEngine(TextToSpeechEngine):
+    """Usa `primary`, mas se ele falhar ou passar de `budget` segundos responde com `fallback`.
+
+    Sem fallback, a síntese que passa do orçamento falha com TimeoutError (quem
+    chama segue sem áudio). Depois de `max_misses` falhas seguidas, o primary é
+    pulado por `cooldown` segundos. Sínteses abandonadas continuam até o fim em
+    segundo plano; enquanto `max_workers` delas ainda estiverem rodando, o
+    primary também é pulado, para não acumular threads presas.
+    """
+
+    def __init__(self, primary, fallback=None, budget=3.0, max_misses=3, cooldown=60.0, max_workers=4):
+        self.primary = primary
+        self.fallback = fallback
+        self.budget = budget
+        self.max_misses = max_misses
+        self.cooldown = cooldown
+        self.max_workers = max_workers
+        self.name = f"{primary.name}+{fallback.name}" if fallback else primary.name
+        self._lock = threading.Lock()
+        self._misses = 0
+        self._skip_until = 0.0
+        self._abandoned = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+
+    def _render_primary(self, text, lang, path):
+        # Grava em um arquivo próprio: se chegar tarde, não sobrescreve o do fallback
+        temporario = f"{path}.{uuid.uuid4().hex}{os.path.splitext(path)[1]}"
+        try:
+            self.primary.render(text, lang, temporario)
+            return temporario
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    def _discard_late(self, future):
+        with self._lock:
+            self._abandoned -= 1
+        if not future.cancelled() and future.exception() is None and os.path.exists(future.result()):
+            os.remove(future.result())
+
+    def _record(self, hit):
+        with self._lock:
+            if hit:
+                self._misses = 0
+                return
+            self._misses += 1
+            if self._misses >= self.max_misses:
+                self._skip_until = time.monotonic() + self.cooldown
+                logger.warning(f"TTS {self.primary.name} lento ou com falhas, pulando por {self.cooldown:.0f}s")
+                self._misses = 0
+
+    def render(self, text, lang, path):
+        with self._lock:
+            pular = time.monotonic() < self._skip_until or self._abandoned >= self.max_workers
+        if not pular:
+            inicio = time.perf_counter()
+            future = self._executor.submit(self._render_primary, text, lang, path)
+            try:
+                os.replace(future.result(timeout=self.budget), path)
+                self._record(True)
+                return True
+            except TimeoutError:
+                logger.warning(f"TTS {self.primary.name} passou de {self.budget}s")
+                with self._lock:
+                    self._abandoned += 1
+                future.add_done_callback(self._discard_late)
+            except Exception as e:
+                logger.error(f"Erro no TTS {self.primary.name} após {time.perf_counter() - inicio:.1f}s: {e}")
+            self._record(False)
+        if self.fallback is None:
+            raise TimeoutError(f"TTS {self.primary.name} indisponível ou acima de {self.budget}s")
+        logger.info(f"Usando TTS {self.fallback.name} no lugar de {self.primary.name}")
+        self.fallback.render(text, lang, path)
+        return False
+
+ENGINES = {
+    GTTSEngine.name: GTTSEngine,
+    CommandLineEngine.name: CommandLineEngine,
+}
+
+def create_engine(name=None, fallback=None, budget=None):
+    """Cria o mecanismo configurado: TTS_ENGINE (gtts ou local), TTS_FALLBACK_ENGINE e TTS_LATENCY_BUDGET_SECONDS.
+
+    O orçamento de latência vale sempre: com mecanismo de reserva o padrão é
+    3 s; sem ele, 15 s, só para uma requisição travada não prender o worker.
+    """
+    name = name or os.environ.get("TTS_ENGINE", GTTSEngine.name)
+    fallback = fallback if fallback is not None else os.environ.get("TTS_FALLBACK_ENGINE", "")
+    budget = budget or float(os.environ.get("TTS_LATENCY_BUDGET_SECONDS", 3 if fallback else 15))
+    for nome in (name, fallback):
+        if nome and nome not in ENGINES:
+            raise ValueError(f"Mecanismo de TTS desconhecido: {nome} (opções: {', '.join(ENGINES)})")
+
+    def build(nome):
+        if nome == CommandLineEngine.name:
+            return CommandLineEngine(os.environ.get("TTS_LOCAL_COMMAND"), os.environ.get("TTS_LOCAL_VOICE"))
+        return GTTSEngine(timeout=float(os.environ.get("TTS_REQUEST_TIMEOUT_SECONDS", 10)))
+
+    reserva = build(fallback) if fallback and fallback != name else None
+    return FallbackEngine(build(name), reserva, budget=budget)
@@ -1,14 +1,14 @@
 # modules/whatsapp_handler.py
 from flask import Response
-from twilio.rest import Client
 import os
 import requests
 import tempfile
 import uuid
-from gtts import gTTS
-from pydub import AudioSegment
 import logging
 import urllib.parse
+from modules.clients import provider
+from modules.outbound_dispatcher import dispatcher
+from modules.tts_cache import synthesizer
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +23,9 @@ class WhatsAppHandler:
             if not all([twilio_sid, twilio_token, self.twilio_number]):
                 logger.warning("Credenciais Twilio incompletas nas variáveis de ambiente")
             
-            self.twilio_client = Client(twilio_sid, twilio_token)
+            self.twilio_client = provider.twilio
+            # Mesmo despachante do app: um único limite de envios para o número
+            self.dispatcher = dispatcher
             
             # Configurar diretório para arquivos estáticos
             self.static_dir = "static"
@@ -45,11 +47,7 @@ class WhatsAppHandler:
     def send_message(self, to, message):
         """Envia mensagem de texto para o WhatsApp"""
         try:
-            self.twilio_client.messages.create(
-                from_=self.twilio_number,
-                to=to,
-                body=message
-            )
+            self.dispatcher.send(to, body=message).result(timeout=60)
             logger.info(f"Mensagem enviada para {to}")
             return True
         except Exception as e:
@@ -59,16 +57,7 @@ class WhatsAppHandler:
     def send_media(self, to, media_url, caption=None):
         """Envia mídia para o WhatsApp"""
         try:
-            message_data = {
-                "from_": self.twilio_number,
-                "to": to,
-                "media_url": [media_url]
-            }
-            
-            if caption:
-                message_data["body"] = caption
-                
-            self.twilio_client.messages.create(**message_data)
+            self.dispatcher.send(to, body=caption or None, media_url=[media_url]).result(timeout=60)
             logger.info(f"Mídia enviada para {to}")
             return True
         except Exception as e:
@@ -120,22 +109,9 @@ class WhatsAppHandler:
     def _generate_audio(self, text):
         """Gera arquivo de áudio a partir de texto"""
         try:
-            # Nome de arquivo único para evitar conflitos
-            audio_filename = os.path.join(self.static_dir, f"audio_{uuid.uuid4().hex}.mp3")
-            ogg_filename = audio_filename.replace(".mp3", ".ogg")
-            
-            # Gerar MP3 com gTTS
-            tts = gTTS(text=text, lang='pt')
-            tts.save(audio_filename)
-            
-            # Converter para OGG (formato que o WhatsApp prefere)
-            AudioSegment.from_file(audio_filename).export(ogg_filename, format="ogg")
-            
-            # Remover arquivo MP3 temporário
-            if os.path.exists(audio_filename):
-                os.remove(audio_filename)
-            
-            return ogg_filename
+            # OGG (formato que o WhatsApp prefere), reaproveitado do cache de TTS
+            # quando o mesmo texto já foi sintetizado
+            return synthesizer.speak(text, fmt="ogg")
         except Exception as e:
             logger.error(f"Erro ao gerar áudio: {str(e)}")
             return None
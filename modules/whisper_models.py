@@ -0,0 +1,95 @@
+# modules/whisper_models.py
+import os
+import threading
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.environ.get("WHISPER_MODEL", "tiny")
+
+class WhisperModelRegistry:
+    """Modelos Whisper carregados uma única vez por processo e compartilhados.
+
+    O modelo só é carregado no primeiro uso (ou no aquecimento). A inferência
+    em um mesmo modelo é serializada: o Whisper instala hooks de cache no
+    modelo durante a decodificação, o que não é seguro entre threads.
+    """
+
+    def __init__(self, default_model=DEFAULT_MODEL):
+        self.default_model = default_model
+        self._lock = threading.Lock()
+        self._models = {}
+        self._model_locks = {}
+        self._ready = set()
+
+    def _model_lock(self, name):
+        with self._lock:
+            return self._model_locks.setdefault(name, threading.Lock())
+
+    def get(self, name=None):
+        """Retorna o modelo `name`, carregando-o no primeiro uso"""
+        name = name or self.default_model
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._model_lock(name):
+            model = self._models.get(name)
+            if model is None:
+                import whisper
+                inicio = time.perf_counter()
+                logger.info(f"Carregando modelo Whisper {name}...")
+                model = whisper.load_model(name)
+                self._models[name] = model
+                logger.info(f"Modelo Whisper {name} carregado em {time.perf_counter() - inicio:.1f}s")
+        return model
+
+    def transcribe(self, audio, name=None, **options):
+        """Transcreve `audio` (caminho ou array float32 a 16 kHz) com o modelo `name`"""
+        name = name or self.default_model
+        model = self.get(name)
+        with self._model_lock(name):
+            return model.transcribe(audio, **options)
+
+    def decode_batch(self, audios, name=None, language="pt", fp16=False):
+        """Decodifica vários áudios de até 30 s de uma vez (mel com padding, um único whisper.decode)"""
+        import torch
+        import whisper
+        name = name or self.default_model
+        model = self.get(name)
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=model.dims.n_mels)
+            for audio in audios
+        ]).to(model.device)
+        options = whisper.DecodingOptions(language=language, fp16=fp16, without_timestamps=True)
+        with self._model_lock(name):
+            results = whisper.decode(model, mel, options)
+        return [{"text": result.text, "language": result.language} for result in results]
+
+    def warmup(self, name=None, background=False):
+        """Carrega o modelo e faz uma inferência com 1 s de silêncio.
+
+        Com background=True roda em uma thread e retorna imediatamente.
+        """
+        name = name or self.default_model
+        if background:
+            thread = threading.Thread(target=self.warmup, args=(name,), name=f"whisper-warmup-{name}", daemon=True)
+            thread.start()
+            return thread
+        try:
+            inicio = time.perf_counter()
+            self.transcribe(np.zeros(16000, dtype=np.float32), name, language="pt", fp16=False)
+            with self._lock:
+                self._ready.add(name)
+            logger.info(f"Modelo Whisper {name} aquecido em {time.perf_counter() - inicio:.1f}s")
+        except Exception as e:
+            logger.error(f"Erro ao aquecer modelo Whisper {name}: {e}")
+
+    def is_ready(self, name=None):
+        """True se o modelo já foi carregado e aquecido"""
+        with self._lock:
+            return (name or self.default_model) in self._ready
+
+# Instância de cada processo de transcrição (usada pelos mecanismos de modules.stt_engines)
+registry = WhisperModelRegistry()
@@ -0,0 +1,94 @@
+# modules/write_buffer.py
+import atexit
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class WriteBuffer:
+    """Agrupa linhas pendentes e grava todas com uma única chamada append_rows.
+
+    A gravação acontece quando a janela de tempo (flush_interval) termina ou quando
+    o número de linhas pendentes chega a max_rows. Cada append_row devolve um
+    Future que é concluído quando a linha foi de fato gravada na planilha.
+    """
+
+    def __init__(self, write_rows, max_rows=20, flush_interval=0.5):
+        self.write_rows = write_rows
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._first_pending_at = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sheet-write-buffer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append_row(self, row):
+        """Adiciona a linha ao buffer e retorna um Future com a confirmação da gravação"""
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Buffer de escrita já foi encerrado")
+            if not self._pending:
+                self._first_pending_at = time.monotonic()
+            self._pending.append((list(row), future))
+            if len(self._pending) == 1 or len(self._pending) >= self.max_rows:
+                self._cond.notify()
+        return future
+
+    def _take_pending(self):
+        with self._cond:
+            pending, self._pending = self._pending, []
+            self._first_pending_at = None
+        return pending
+
+    def flush(self):
+        """Grava imediatamente todas as linhas pendentes"""
+        with self._flush_lock:
+            pending = self._take_pending()
+            if not pending:
+                return
+            rows = [row for row, _ in pending]
+            try:
+                self.write_rows(rows)
+                logger.info(f"{len(rows)} linhas gravadas na planilha em uma única chamada")
+            except Exception as e:
+                logger.error(f"Erro ao gravar {len(rows)} linhas na planilha: {e}")
+                for _, future in pending:
+                    future.set_exception(e)
+                return
+            for _, future in pending:
+                future.set_result(True)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._pending:
+                        if len(self._pending) >= self.max_rows:
+                            break
+                        restante = self._first_pending_at + self.flush_interval - time.monotonic()
+                        if restante <= 0:
+                            break
+                        self._cond.wait(restante)
+                    else:
+                        self._cond.wait()
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """Encerra o buffer gravando o que estiver pendente (chamado também no desligamento)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=30)
+        self.flush()
@@ -5,6 +5,7 @@ import tempfile
 import uuid
 from datetime import datetime, timedelta
 import logging
+from utils.money import parse_brl_cents
 
 logger = logging.getLogger(__name__)
 
@@ -27,20 +28,12 @@ def extract_amount_from_text(text):
     for pattern in patterns:
         match = re.search(pattern, text, re.IGNORECASE)
         if match:
-            amount_str = match.group(1).replace(',', '.')
-            try:
-                return float(amount_str)
-            except:
-                pass
+            return parse_brl_cents(match.group(1)) / 100
     
     # Procurar por números isolados como último recurso
     amount_match = re.search(r'(\d+(?:[,.]\d+)?)', text)
     if amount_match:
-        amount_str = amount_match.group(1).replace(',', '.')
-        try:
-            return float(amount_str)
-        except:
-            pass
+        return parse_brl_cents(amount_match.group(1)) / 100
     
     return None
 
@@ -0,0 +1,82 @@
+# utils/money.py
+from functools import lru_cache
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def parse_brl_cents(value, default=0):
+    """Converte um valor em reais ("R$1.234,56", "25,5", "150.50", 12.3) em centavos (int).
+
+    Lê apenas o primeiro número do texto (dígitos com separadores "." ou ","
+    entre eles). O último separador seguido de 1 ou 2 dígitos é tratado como
+    separador decimal; os demais são separadores de milhar. Retorna default se
+    não houver nenhum dígito e None se houver outros dígitos depois do número
+    (ex.: "25 reais e 50 centavos", "25 50"), para um valor ambíguo não ser
+    gravado errado.
+    """
+    if isinstance(value, bool):
+        return default
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        return int(round(value * 100))
+
+    texto = str(value)
+    digits = 0
+    decimals = -1
+    seen_digit = False
+    negative = False
+    fim = len(texto)
+    for i, ch in enumerate(texto):
+        if "0" <= ch <= "9":
+            digits = digits * 10 + (ord(ch) - 48)
+            seen_digit = True
+            if decimals >= 0:
+                decimals += 1
+        elif seen_digit:
+            # Separador só continua o número se vier seguido de dígito
+            if (ch == "," or ch == ".") and i + 1 < len(texto) and "0" <= texto[i + 1] <= "9":
+                decimals = 0
+            else:
+                fim = i
+                break
+        elif ch == "-":
+            negative = True
+
+    if not seen_digit:
+        return default
+    if any("0" <= ch <= "9" for ch in texto[fim:]):
+        return None
+    if decimals == 1:
+        cents = digits * 10
+    elif decimals == 2:
+        cents = digits
+    else:
+        cents = digits * 100
+    return -cents if negative else cents
+
+def parse_brl_cents_array(values, default=0):
+    """Converte uma coluna de valores (lista, array ou Series) em um array int64 de centavos.
+
+    Valores repetidos (muito comuns na planilha) são convertidos uma única vez.
+    """
+    memo = {}
+    def _parse(value):
+        key = value if isinstance(value, str) else repr(value)
+        if key not in memo:
+            cents = parse_brl_cents(value, default)
+            memo[key] = default if cents is None else cents
+        return memo[key]
+    return np.fromiter((_parse(v) for v in values), dtype=np.int64, count=len(values))
+
+@lru_cache(maxsize=4096)
+def format_brl(cents, prefix="R$"):
+    """Formata centavos (int) como moeda brasileira: 123456 -> "R$1.234,56" """
+    sign = "-" if cents < 0 else ""
+    reais, centavos = divmod(abs(int(cents)), 100)
+    return f"{prefix}{sign}{reais:,}".replace(",", ".") + f",{centavos:02d}"
+
+def to_cents(valor):
+    """Converte um float em reais para centavos (int), arredondando"""
+    return int(round(valor * 100))